@@ -1,10 +1,23 @@
 import streamlit as st
 import pandas as pd
 import os
-import requests
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import altair as alt # Importamos altair
-from utils.date_utils import get_accounting_month
+from utils.aggregates import MonthlyCube
+from utils.budget import BudgetEngine, budget_vs_actual
+from utils.cartola_parsers import read_cartola
+from utils.categorizer import Categorizer
+from utils.data_context import DataContext, normalizar_facts, preparar_facts
+from utils.date_utils import accounting_month_bounds
+from utils.facts_sync import FactsSync
+from utils.fingerprints import FingerprintIndex
+from utils.payloads import changed_rows, facts_insert_payloads, facts_update_payloads
+from utils.perf import Tracer, activate, propagate, span, traced
+from utils.search_index import DetailIndex
+from utils.snapshot import SnapshotStore, WarmStart
+from utils.query_cache import QueryCache
+from utils.supabase_client import NO_UNIQUE_KEY, UNKNOWN_COLUMN, SupabaseDB
 
 # --- GLOBAL INITIALIZATION (Garantiza que las variables existan para evitar NameError) ---
 df_cat_map = pd.DataFrame(columns=['Categoria', 'Tipo', 'Agrupador'])
@@ -34,64 +47,80 @@ if not SUPABASE_URL or not SUPABASE_KEY:
     url = "https://tu-url.supabase.co"
     key = "tu-anon-key"
     api_secret = "tu-service-role-key"
+    pool_size = 10  # Opcional: conexiones HTTP reutilizables
+    snapshot_dir = "data/snapshot"  # Opcional: snapshot local para arranque instantáneo
+    cache_ttl = 300  # Opcional: segundos de vida de la caché de consultas
     ```
     """)
     st.stop()
 
-class SupabaseDB:
-    def __init__(self, url, key):
-        self.url = url.rstrip('/') + "/rest/v1"
-        self.headers = {
-            "apikey": key,
-            "Authorization": f"Bearer {key}",
-            "Content-Type": "application/json",
-            "Prefer": "return=representation"
-        }
+@st.cache_resource
+def get_supabase(url, key, pool_size=10, cache_ttl=300):
+    """Cliente Supabase compartido entre reruns (pool de conexiones + caché de consultas)"""
+    return SupabaseDB(url, key, pool_size=pool_size, cache=QueryCache(ttl=cache_ttl))
 
-    def query(self, table, select="*", filters=None):
-        url = f"{self.url}/{table}?select={select}"
-        if filters:
-            for k, v in filters.items():
-                url += f"&{k}={v}"
-        try:
-            res = requests.get(url, headers=self.headers)
-            if res.status_code == 200:
-                return pd.DataFrame(res.json())
-            else:
-                st.error(f"Supabase Query Error ({res.status_code}): {res.text}")
-                return pd.DataFrame()
-        except Exception as e:
-            st.error(f"Supabase Connection Fatal Error: {str(e)}")
-            return pd.DataFrame()
-
-    def upsert(self, table, data, on_conflict="id"):
-        headers = self.headers.copy()
-        headers["Prefer"] = "return=representation,resolution=merge-duplicates"
-        url = f"{self.url}/{table}?on_conflict={on_conflict}"
-        try:
-            res = requests.post(url, json=data, headers=headers)
-            return res.status_code in [200, 201, 204], res.text
-        except Exception as e:
-            return False, str(e)
-
-    def insert(self, table, data):
-        try:
-            res = requests.post(f"{self.url}/{table}", json=data, headers=self.headers)
-            return res.status_code in [200, 201], res.text
-        except Exception as e:
-            return False, str(e)
-
-    def update(self, table, data, filters):
-        url = f"{self.url}/{table}"
-        if filters:
-            url += "?" + "&".join([f"{k}={v}" for k, v in filters.items()])
-        try:
-            res = requests.patch(url, json=data, headers=self.headers)
-            return res.status_code in [200, 204], res.text
-        except Exception as e:
-            return False, str(e)
-
-sdb = SupabaseDB(SUPABASE_URL, SUPABASE_KEY)
+try:
+    SUPABASE_POOL_SIZE = int(st.secrets.get("supabase", {}).get("pool_size", 10))
+    SUPABASE_CACHE_TTL = int(st.secrets.get("supabase", {}).get("cache_ttl", 300))
+except Exception:
+    SUPABASE_POOL_SIZE = 10
+    SUPABASE_CACHE_TTL = 300
+
+sdb = get_supabase(SUPABASE_URL, SUPABASE_KEY, SUPABASE_POOL_SIZE, SUPABASE_CACHE_TTL)
+
+@st.cache_resource
+def get_facts_sync(_sdb):
+    """Copia residente de facts (ya compacta) sincronizada por deltas (updated_at) entre reruns"""
+    return FactsSync(_sdb, transform=preparar_facts)
+
+facts_sync = get_facts_sync(sdb)
+
+try:
+    SNAPSHOT_DIR = st.secrets.get("supabase", {}).get("snapshot_dir", os.path.join("data", "snapshot"))
+except Exception:
+    SNAPSHOT_DIR = os.path.join("data", "snapshot")
+
+@st.cache_resource
+def get_warm_start(_sdb, _facts_sync, directory, source):
+    """Snapshot local para el arranque en frío; se reconcilia con la nube en segundo plano"""
+    def cargar_desde_nube():
+        ctx_nube = DataContext(_sdb, facts_sync=_facts_sync).load()
+        if ctx_nube.errors:
+            raise RuntimeError(f"Carga incompleta: {ctx_nube.errors}")
+        return ctx_nube.tables(), ctx_nube.stamp()
+    warm = WarmStart(SnapshotStore(directory, source=source), loader=cargar_desde_nube)
+    warm.start()
+    return warm
+
+warm_start = get_warm_start(sdb, facts_sync, SNAPSHOT_DIR, SUPABASE_URL)
+
+@st.cache_resource
+def get_fingerprint_index():
+    """Índice hash de huellas de facts para detectar duplicados al importar (se actualiza incrementalmente)"""
+    return FingerprintIndex()
+
+@st.cache_resource
+def get_monthly_cube():
+    """Cubo mensual (mes, categoría, tipo, conciliado, signo) del Home, mantenido incrementalmente"""
+    return MonthlyCube()
+
+@st.cache_resource
+def get_categorizer():
+    """Categorizador entrenado con los movimientos conciliados (se reentrena solo si cambian)"""
+    return Categorizer()
+
+# Confianza mínima para aplicar una categoría sugerida sin revisión
+UMBRAL_AUTOCATEGORIA = 0.8
+
+# Vista de conciliación: columnas pedidas al servidor y tope de filas por consulta
+COLUMNAS_CONCILIACION = "id,date,period,detail,amount,bank,category_id,categories(name)"
+LIMITE_CONCILIACION = 1000
+MAX_IDS_EN_FILTRO = 300
+
+@st.cache_resource
+def get_detail_index():
+    """Índice invertido de tokens de Detalle (sin tildes ni mayúsculas) + montos, compartido entre reruns"""
+    return DetailIndex()
 
 # --- CONFIGURACIÓN GLOBAL ---
 st.set_page_config(page_title="Mi Conciliador Pro", layout="wide")
@@ -100,6 +129,15 @@ st.set_page_config(page_title="Mi Conciliador Pro", layout="wide")
 if "last_sync" not in st.session_state:
     st.session_state["last_sync"] = datetime.now().strftime("%H:%M:%S")
 
+# --- TRAZAS DE RENDIMIENTO ---
+# Un tracer por sesión, desactivado por defecto (costo ~0); se activa desde el panel oculto
+# de Configuración (abrir la app con ?perf=1)
+if "perf_tracer" not in st.session_state:
+    st.session_state["perf_tracer"] = Tracer()
+tracer = st.session_state["perf_tracer"]
+activate(tracer)
+tracer.begin_run(st.session_state.get("vista_activa", ""))
+
 
 # --- FUNCIONES DE APOYO ---
 def formatear_monto(monto):
@@ -109,6 +147,12 @@ def formatear_monto(monto):
     except:
         return str(monto)
 
+def formatear_montos(montos):
+    """Versión vectorizada de formatear_monto para una Serie completa"""
+    valores = pd.to_numeric(montos, errors='coerce').fillna(0).round(0).astype('int64')
+    cifras = valores.abs().astype(str).str.replace(r'(\d)(?=(\d{3})+$)', r'\1.', regex=True)
+    return '$' + cifras.where(valores >= 0, '-' + cifras)
+
 def Reparar_datos_existentes(df):
     """Repara errores de parsing de fechas previos (ej: 12-02-2026 -> 2026-12-02)"""
     if df.empty: return df
@@ -138,138 +182,14 @@ def Reparar_datos_existentes(df):
         
     return df
 
-def normalizar_dataframe_import(df):
-    """Estandariza fechas y montos en el momento de la importación (Cartola)"""
-    if df.empty: return df
-    
-    # 1. Normalizar FECHAS a string DD-MM-YYYY
-    # Forzamos dayfirst=True para formato local cartolas
-    df['Fecha_tmp'] = pd.to_datetime(df['Fecha'], dayfirst=True, errors='coerce')
-    # Los que no pudieron, intentamos sin dayfirst (ISO)
-    fallidos = df['Fecha_tmp'].isna()
-    if fallidos.any():
-        df.loc[fallidos, 'Fecha_tmp'] = pd.to_datetime(df.loc[fallidos, 'Fecha'], errors='coerce')
-    
-    # Convertimos a string estándar DD-MM-YYYY para la base de datos (PATH_BANCO)
-    df['Fecha'] = df['Fecha_tmp'].dt.strftime('%d-%m-%Y')
-    
-    # 2. Normalizar MONTOS
-    if df['Monto'].dtype == object:
-        df['Monto'] = df['Monto'].astype(str).str.replace('$', '', regex=False).str.replace('.', '', regex=False).str.replace(',', '.', regex=False).str.replace('\xa0', '', regex=False).str.strip()
-    df['Monto'] = pd.to_numeric(df['Monto'], errors='coerce').fillna(0)
-    
-    return df.drop(columns=['Fecha_tmp'], errors='ignore')
-
-def cargar_datos():
-    """Carga movimientos desde Supabase PostgreSQL (facts join categories)"""
-    # Usamos select con join a categories para traer el nombre
-    df = sdb.query("facts", select="*,categories(name)")
-    if df.empty:
-        return pd.DataFrame(columns=['id', 'Fecha', 'Detalle', 'Monto', 'Banco', 'Categoria', 'status', 'period'])
-    
-    # Normalización del layout para la app
-    df = df.rename(columns={
-        'date': 'Fecha',
-        'detail': 'Detalle',
-        'amount': 'Monto',
-        'bank': 'Banco'
-    })
-    
-    # Extraer el nombre de la categoría del objeto retornado por Supabase (join)
-    if 'categories' in df.columns:
-        df['Categoria'] = df['categories'].apply(lambda x: x.get('name') if isinstance(x, dict) else 'Pendiente')
-    else:
-        df['Categoria'] = 'Pendiente'
-        
-    # Asegurar tipos
-    df['Fecha_dt'] = pd.to_datetime(df['Fecha'], errors='coerce')
-    df['Monto'] = pd.to_numeric(df['Monto'], errors='coerce').fillna(0)
-    
-    return df
-
-def cargar_categorias(full=False):
-    """Obtiene lista de categorías desde Supabase. Si full=True devuelve DataFrame."""
-    df = sdb.query("categories")
-    if df.empty:
-        df = pd.DataFrame(columns=['name', 'type', 'grouper'])
-    
-    if full:
-        return df.rename(columns={'name': 'Categoria', 'type': 'Tipo', 'grouper': 'Agrupador'})
-    
-    if not df.empty:
-        return sorted(df['name'].unique().tolist())
-    return ["Alimentación", "Transporte", "Vivienda", "Ocio", "Suscripciones", "Pendiente"]
-
-def cargar_presupuesto(lista_categorias):
-    """Carga presupuesto desde Supabase y lo pivota para la vista actual"""
-    df = sdb.query("budget", select="*,categories(name)")
-    
-    # Si está vacío, creamos un DF base con las categorías actuales
-    if df.empty:
-        df_pivot = pd.DataFrame({'Categoria': lista_categorias})
-    else:
-        # Extraer nombre
-        df['Categoria'] = df['categories'].apply(lambda x: x.get('name') if isinstance(x, dict) else 'Unknown')
-        # Pivotar: Index=Categoria, Columns=period, Values=amount
-        df_pivot = df.pivot(index='Categoria', columns='period', values='amount').reset_index().fillna(0)
-    
-    # Asegurar que todas las categorías existan en el presupuesto (Sincronización)
-    cat_existentes = set(df_pivot['Categoria'].tolist()) if not df_pivot.empty else set()
-    for cat in lista_categorias:
-        if cat not in cat_existentes:
-            nueva_fila = {col: 0 for col in df_pivot.columns}
-            nueva_fila['Categoria'] = cat
-            df_pivot = pd.concat([df_pivot, pd.DataFrame([nueva_fila])], ignore_index=True)
-            
-    return df_pivot
-
-
+@traced("procesar_archivo")
 def procesar_archivo(archivo):
-    """Detecta el tipo de archivo y lo procesa automáticamente"""
+    """Detecta el tipo de archivo y lo procesa automáticamente (una sola lectura, ver utils/cartola_parsers)"""
     try:
-        # 1. Intento de lectura Santander (.xlsx)
-        if archivo.name.endswith('.xlsx'):
-            df_meta = pd.read_excel(archivo, nrows=5, header=None)
-            texto_completo = df_meta.astype(str).values.flatten()
-            texto_completo = " ".join(texto_completo)
-            
-            CUENTA_PROPIA = "0-000-74-80946-4"
-            
-            if CUENTA_PROPIA in texto_completo:
-                # Usamos header=0 y buscamos la fila donde están los títulos reales
-                df = pd.read_excel(archivo, skiprows=2) 
-                df.columns = df.columns.str.strip() # Limpieza de espacios
-                
-                # Buscamos columnas por nombre parcial para evitar el KeyError
-                col_cargo = [c for c in df.columns if 'Monto cargo' in c][0]
-                col_abono = [c for c in df.columns if 'Monto abono' in c][0]
-                col_fecha = [c for c in df.columns if 'Fecha' in c][0]
-                col_detalle = [c for c in df.columns if 'Detalle' in c][0]
-                
-                df['Monto'] = pd.to_numeric(df[col_abono], errors='coerce').fillna(0) - \
-                              pd.to_numeric(df[col_cargo], errors='coerce').fillna(0)
-                
-                df_final = df[[col_fecha, col_detalle, 'Monto']].copy()
-                df_final.columns = ['Fecha', 'Detalle', 'Monto']
-                df_final['Banco'] = 'CC Santander'
-                df_final['Categoria'] = 'Pendiente'
-                # Normalización INMEDIATA al detectar
-                df_final = normalizar_dataframe_import(df_final)
-                st.success(f"✅ Santander detectado: Cuenta {CUENTA_PROPIA}")
-                return df_final
-            
-        # 2. Intento de lectura Genérico (.csv)
-        elif archivo.name.endswith('.csv'):
-            df = pd.read_csv(archivo, sep=None, engine='python')
-            df.columns = df.columns.str.strip()
-            columnas_req = {'Fecha', 'Detalle', 'Monto'}
-            if columnas_req.issubset(df.columns):
-                df['Banco'] = 'Genérico'
-                df['Categoria'] = 'Pendiente'
-                # Normalización INMEDIATA
-                df = normalizar_dataframe_import(df[list(columnas_req) + ['Banco', 'Categoria']])
-                st.success("✅ Archivo CSV estándar detectado")
-                return df
+        df, parser = read_cartola(archivo, archivo.name)
+        if df is not None:
+            st.success(f"✅ {parser.label}")
+            return df
         
         st.error("❌ Formato no reconocido o cuenta no autorizada.")
         return None
@@ -296,54 +216,104 @@ def highlight_duplicates(df):
 st.title("💰 Conciliador Bancario Inteligente")
 st.caption("v2.2.5 - Cloud Native (Robust Sync)")
 
-# Intentar cargar datos reales (Sobrescribe las inicializaciones si hay éxito)
+# Contexto de datos del rerun: cada tabla se carga una sola vez y se comparte entre pestañas
+# Mientras la nube se reconcilia en segundo plano, se sirve el snapshot local (primer pintado sin red)
+ctx = DataContext(sdb, facts_sync=facts_sync, snapshot=warm_start.tables if warm_start.serving else None)
+
+if ctx.snapshot is not None:
+    st.caption(f"⚡ Mostrando snapshot local del {warm_start.manifest['saved_at']} · sincronizando con la nube...")
+
+    @st.fragment(run_every=2)
+    def esperar_sincronizacion():
+        # Cuando termina la reconciliación, rerun completo con los datos vivos
+        if warm_start.ready.is_set():
+            st.rerun()
+
+    esperar_sincronizacion()
+
+# Carga inicial: facts, categorías y presupuesto se piden en paralelo (latencia ~ la consulta más lenta)
 try:
-    df_raw = cargar_datos()
-    df_cat_map = cargar_categorias(full=True)
-    df_presupuesto = cargar_presupuesto(cargar_categorias())
+    ctx.load()
+    df_raw = ctx.facts
+    df_cat_map = ctx.cat_map
+    df_presupuesto = ctx.presupuesto
 except Exception as e:
     st.error(f"❌ Error crítico al inicializar datos: {str(e)}")
-
-tab_home, tab_budget, tab1, tab2, tab3 = st.tabs(["🏠 Home / Resumen", "💰 Presupuesto", "📥 Cargar Cartola", "📊 Conciliación y Categorías", "⚙️ Configuración"])
-
-with tab_home:
+else:
+    # Fallas parciales: se avisa por fuente y el resto de la app sigue funcionando
+    for fuente, error in ctx.errors.items():
+        st.warning(f"⚠️ No se pudo cargar '{fuente}': {error[:300]}")
+    # Persistir snapshot local (en segundo plano, solo si los datos cambiaron y la carga fue completa)
+    if ctx.snapshot is None and not ctx.errors:
+        warm_start.save_async(ctx.tables(), ctx.stamp())
+
+# --- VISTAS ---
+# Cada vista es una función y solo se ejecuta la activa: un rerun cuesta lo que cuesta la vista visible
+# (st.tabs ejecutaba el cuerpo de las cinco pestañas en cada rerun)
+
+def vista_home(ctx):
+    """🏠 Resumen del mes: KPIs, comparativo Real vs Meta y gráfico por tipo"""
     st.header("Resumen Financiero")
     
-    # Ya definidos globalmente: df_raw, df_cat_map, df_presupuesto
+    # Ya definidos globalmente: df_raw, df_cat_map, df_presupuesto (solo lectura, vienen de ctx)
     
     if not df_raw.empty:
-        # Mes Contable (Ya tenemos Fecha_dt desde cargar_datos)
-        df_raw['Mes_Contable'] = df_raw['Fecha_dt'].apply(get_accounting_month)
-        
-        # Filtro de Mes
-        meses_disp = sorted(df_raw['Mes_Contable'].dropna().unique().tolist(), reverse=True)
+        # Cubo agregado: solo se re-agregan los movimientos nuevos o modificados desde el último rerun
+        cubo = get_monthly_cube()
+        with span("home.cubo", rows=len(df_raw)):
+            cubo.sync(df_raw, ctx.tipo_map)
+
+        # Filtro de Mes (Mes_Contable ya viene calculado en ctx.facts)
+        meses_disp = cubo.months()
         col_filtro, col_sync, col_vacio = st.columns([1, 1, 2])
         with col_filtro:
             mes_sel = st.selectbox("Seleccionar Mes Contable", meses_disp)
         with col_sync:
             if st.button("🔄 Refrescar Datos de la Nube"):
-                st.cache_data.clear()
+                sdb.cache.clear()
+                facts_sync.invalidate()
                 st.session_state["last_sync"] = datetime.now().strftime("%H:%M:%S")
                 st.rerun()
             
         with st.expander("📊 Estado de la Base de Datos"):
             st.write(f"**Total de Registros:** {len(df_raw)}")
-            resumen_meses = df_raw.groupby('Mes_Contable').size().reset_index(name='Registros')
+            st.caption(f"🧠 Memoria de movimientos: {df_raw.memory_usage(deep=True).sum() / 2**20:.1f} MB")
+            resumen_meses = cubo.counts_by_month()
             st.write("**Registros por Mes Contable:**")
             st.dataframe(resumen_meses, use_container_width=True)
             
+            # Contadores del pool HTTP (para confirmar reutilización de conexiones)
+            http_stats = sdb.stats()
+            st.caption(
+                f"🔌 HTTP: {http_stats['requests']} requests · "
+                f"{http_stats['connections_opened']} conexiones abiertas · "
+                f"{http_stats['connections_reused']} reutilizadas · "
+                f"{http_stats['retries']} reintentos"
+            )
+            if ctx.timings:
+                st.caption("⏱️ Carga inicial: " + " · ".join(f"{fuente} {seg:.2f}s" for fuente, seg in ctx.timings.items()))
+            sync_stats = facts_sync.stats
+            st.caption(
+                f"🔁 Sync: {sync_stats['full_syncs']} completas · {sync_stats['delta_syncs']} incrementales · "
+                f"{sync_stats['rows_fetched']} filas descargadas"
+            )
+            cache_stats = sdb.cache.stats()
+            st.caption(
+                f"🗃️ Caché: {cache_stats['hits']} aciertos · {cache_stats['misses']} fallos "
+                f"({cache_stats['hit_rate']:.0%}) · {cache_stats['entries']} entradas · "
+                f"{cache_stats['invalidations']} invalidadas"
+            )
+            
             mes_actual = datetime.now().strftime('%Y-%m')
             futuros = [m for m in resumen_meses['Mes_Contable'].tolist() if m > mes_actual and m != '2026-03'] # Permitimos un mes de margen
             if futuros:
                 st.error(f"⚠️ ¡Atención! Hay registros en meses futuros: {futuros}. Esto indica errores de fecha.")
 
         if mes_sel:
-            # Filtrar datos del mes seleccionado
-            df_mes = df_raw[df_raw['Mes_Contable'] == mes_sel]
-            
-            # Métricas Clave Real
-            total_gastos = df_mes[df_mes['Monto'] < 0]['Monto'].sum()
-            total_ingresos = df_mes[df_mes['Monto'] > 0]['Monto'].sum()
+            # Métricas Clave Real (desde las celdas del cubo para el mes seleccionado)
+            totales_mes = cubo.month_totals(mes_sel)
+            total_gastos = totales_mes['gastos']
+            total_ingresos = totales_mes['ingresos']
             balance = total_gastos + total_ingresos
             
             # Obtener Presupuesto del Mes
@@ -354,11 +324,8 @@ with tab_home:
             col_m1, col_m2, col_m3 = st.columns(3)
             
             # Ingresos Reales con desglose Conciliado vs Pendiente
-            df_reconciliado = df_mes[df_mes['Categoria'] != 'Pendiente']
-            df_pendiente = df_mes[df_mes['Categoria'] == 'Pendiente']
-            
-            ingr_conciliado = df_reconciliado[df_reconciliado['Monto'] > 0]['Monto'].sum()
-            ingr_pendiente = df_pendiente[df_pendiente['Monto'] > 0]['Monto'].sum()
+            ingr_conciliado = totales_mes['ingresos_conciliado']
+            ingr_pendiente = totales_mes['ingresos_pendiente']
             
             # El KPI principal muestra el total, el detalle abajo el desglose
             col_m1.metric("Ingresos Reales (Total)", formatear_monto(total_ingresos))
@@ -381,71 +348,17 @@ with tab_home:
             
             st.divider()
             
-            # Preparar datos por Tipo/Orden
-            tipo_map = dict(zip(df_cat_map['Categoria'], df_cat_map['Tipo']))
-            
-            # Orden de tipos: Ingresos (1), Pendientes (2), Gastos fijos (3), Gastos Variables (4)
-            orden_tipos = {"Ingresos": 1, "Pendiente": 2, "Gastos fijos": 3, "Gastos Variables": 4}
-            
-            # Preparar datos agrupados (Incluimos todo: ingresos y gastos)
-            df_movs = df_mes.copy()
-            # Limpieza AGRESIVA antes de agrupar
-            df_movs['Categoria'] = df_movs['Categoria'].astype(str).replace(r'\s+', ' ', regex=True).str.strip()
-            df_movs['Monto_Abs'] = df_movs['Monto'].abs()
-            movimientos_real = df_movs.groupby('Categoria')['Monto_Abs'].sum().reset_index()
-            
-            # Merge con Presupuesto
-            if mes_sel in df_presupuesto.columns:
-                presup_mes = df_presupuesto[['Categoria', mes_sel]].rename(columns={mes_sel: 'Presupuesto'})
-                presup_mes['Categoria'] = presup_mes['Categoria'].astype(str).replace(r'\s+', ' ', regex=True).str.strip()
-                gastos_comparativo = pd.merge(movimientos_real, presup_mes, on='Categoria', how='outer').fillna(0)
-            else:
-                presup_mes = pd.DataFrame(columns=['Categoria', 'Presupuesto'])
-                gastos_comparativo = movimientos_real.copy()
-                gastos_comparativo['Presupuesto'] = 0
-            
-            # Filtramos solo aquellos que tengan movimiento o presupuesto
-            gastos_comparativo = gastos_comparativo[(gastos_comparativo['Monto_Abs'] > 0) | (gastos_comparativo['Presupuesto'] > 0)]
-            
-            # Asignar tipos para aplicar lógica de diferencia diferenciada
-            # Aseguramos que tipo_map esté limpio de forma agresiva
-            tipo_map_clean = {str(k).strip(): v for k, v in tipo_map.items()}
-            gastos_comparativo['Tipo_Cat'] = gastos_comparativo['Categoria'].apply(lambda x: tipo_map_clean.get(x, 'Otros'))
-
-            # Lógica de Diferencia:
-            # - Si es Ingresos: Real - Meta (Positivo si ganaste más, negativo rojo si ganaste menos)
-            # - Si es Gasto (u otro): Meta - Real (Positivo si gastaste menos, negativo rojo si gastaste más)
-            def calcular_diferencia(row):
-                if row['Tipo_Cat'] == 'Ingresos':
-                    return row['Monto_Abs'] - row['Presupuesto']
-                else:
-                    return row['Presupuesto'] - row['Monto_Abs']
+            # Montos por categoría del mes (ingresos y gastos, categorías ya limpias en el cubo)
+            movimientos_real = cubo.by_category(mes_sel)
 
-            gastos_comparativo['Diferencia'] = gastos_comparativo.apply(calcular_diferencia, axis=1)
-            gastos_comparativo['Orden'] = gastos_comparativo['Tipo_Cat'].apply(lambda x: orden_tipos.get(x, 99))
-            
-            # Ordenar: primero por Tipo (Orden) y luego por Monto
-            gastos_comparativo = gastos_comparativo.sort_values(['Orden', 'Monto_Abs'], ascending=[True, False])
+            # Comparativo Real vs Meta por categoría (columnar: np.where + códigos categóricos para el orden)
+            with span("home.comparativo"):
+                gastos_comparativo = budget_vs_actual(movimientos_real, df_presupuesto, mes_sel, ctx.tipo_map)
             
             # Añadir Fila de TOTAL (Ingresos - Gastos)
-            # Aseguramos que el cruce use categorías limpias
-            gastos_real_con_tipo = pd.merge(movimientos_real, df_cat_map[['Categoria', 'Tipo']], on='Categoria', how='left')
-            # Si no tiene tipo pero es 'Pendiente', le asignamos 'Pendiente'
-            mask_pend = (gastos_real_con_tipo['Tipo'].isna()) & (gastos_real_con_tipo['Categoria'] == 'Pendiente')
-            gastos_real_con_tipo.loc[mask_pend, 'Tipo'] = 'Pendiente'
-            
-            # Suma de Ingresos: Todo lo que sea tipo 'Ingresos' O que sea Pendiente con monto positivo
-            # En movimientos_real todos son positivos (Monto_Abs), así que discriminamos con df_mes
-            sum_ingresos_real = total_ingresos
-            sum_gastos_real = abs(total_gastos)
-            total_real_balance = sum_ingresos_real - sum_gastos_real
-            
-            presup_con_tipo = pd.merge(presup_mes, df_cat_map[['Categoria', 'Tipo']], on='Categoria', how='left')
-            # El presupuesto de ingresos es positivo
-            sum_ingresos_presup = presup_con_tipo[presup_con_tipo['Tipo'] == 'Ingresos']['Presupuesto'].sum()
-            sum_gastos_presup = presup_con_tipo[presup_con_tipo['Tipo'] != 'Ingresos']['Presupuesto'].sum()
-            total_presup_balance = sum_ingresos_presup - sum_gastos_presup
-            
+            total_real_balance = total_ingresos - abs(total_gastos)
+            # Meta: ingresos presupuestados menos gastos presupuestados (producto matricial del motor de presupuesto)
+            total_presup_balance = BudgetEngine(df_presupuesto, ctx.tipo_map).net_for(mes_sel)
             total_dif_balance = total_presup_balance - total_real_balance
             
             fila_total = pd.DataFrame({
@@ -459,28 +372,23 @@ with tab_home:
             
             gastos_comparativo_con_total = pd.concat([gastos_comparativo, fila_total], ignore_index=True)
 
-            # Preparar DF para visualización (con puntos forzados)
-            df_display_comparativo = gastos_comparativo_con_total.copy()
-            for col in ['Monto_Abs', 'Presupuesto', 'Diferencia']:
-                df_display_comparativo[col] = df_display_comparativo[col].apply(formatear_monto)
+            # Preparar DF para visualización (con puntos forzados, formateo vectorizado)
+            cols_montos = ['Monto_Abs', 'Presupuesto', 'Diferencia']
+            df_display_comparativo = gastos_comparativo_con_total[['Categoria']].assign(
+                **{col: formatear_montos(gastos_comparativo_con_total[col]) for col in cols_montos}
+            )
 
             # Visualización: Tabla primero, luego Gráfico debajo
             st.subheader("Detalle del Mes")
             if not gastos_comparativo.empty:
-                # Función para pintar de rojo las diferencias negativas
-                def style_diff(row):
-                    val_original = gastos_comparativo_con_total.loc[row.name, 'Diferencia']
-                    styles = ['' for _ in row.index]
-                    if val_original < 0:
-                        # Buscamos el índice de la columna 'Diferencia' en el DF de visualización
-                        col_idx = list(row.index).index('Diferencia')
-                        styles[col_idx] = 'color: red; font-weight: bold'
-                    return styles
+                # Máscara de estilos precalculada: diferencias negativas en rojo
+                estilos = pd.DataFrame('', index=df_display_comparativo.index, columns=df_display_comparativo.columns)
+                estilos.loc[(gastos_comparativo_con_total['Diferencia'] < 0).to_numpy(), 'Diferencia'] = 'color: red; font-weight: bold'
 
                 # Calcular altura dinámica para evitar scroll
                 h_dinamico = (len(gastos_comparativo_con_total) + 1) * 35 + 40
                 st.dataframe(
-                    df_display_comparativo[['Categoria', 'Monto_Abs', 'Presupuesto', 'Diferencia']].style.apply(style_diff, axis=1),
+                    df_display_comparativo.style.apply(lambda _: estilos, axis=None),
                     column_config={
                         "Categoria": st.column_config.TextColumn("Categoría"),
                         "Monto_Abs": st.column_config.TextColumn("Real"),
@@ -519,12 +427,12 @@ with tab_home:
     else:
         st.info("💡 No hay movimientos. Ve a la pestaña 'Cargar Cartola' para subir tus primeros datos.")
 
-with tab_budget:
+def vista_presupuesto(ctx):
+    """💰 Editor de presupuesto por año con saldos mensual y acumulado"""
     st.header("Planificación Presupuestaria")
     st.markdown("Define tus metas de gasto mensual por categoría. Los montos se guardarán automáticamente.")
     
-    lista_cats = cargar_categorias()
-    df_budget = cargar_presupuesto(lista_cats)
+    df_budget = ctx.presupuesto
     
     # Filtro de Año
     # Identificar años disponibles en las columnas (format YYYY-MM)
@@ -536,7 +444,7 @@ with tab_budget:
     anio_sel = st.selectbox("📅 Filtrar por Año", anios_disponibles, index=default_index)
     
     # Obtener Tipos de Categoría para Cálculos de Saldo
-    tipo_map = dict(zip(df_cat_map['Categoria'], df_cat_map['Tipo']))
+    tipo_map = ctx.tipo_map
 
     # Filtrar columnas del DF para mostrar solo el año seleccionado + Categoria
     cols_to_show = ["Categoria"] + [c for c in cols_meses if c.startswith(str(anio_sel))]
@@ -545,42 +453,46 @@ with tab_budget:
     # --- VISTA DEL EDITOR (Primero) ---
     df_budget_visual = df_budget_display.copy()
 
+    def guardar_celda_presupuesto(fila):
+        """Actualiza la celda (category_id, period) o la inserta si no existe."""
+        ok, texto = sdb.update("budget", {"amount": fila["amount"]},
+                               filters={"category_id": f"eq.{fila['category_id']}", "period": f"eq.{fila['period']}"})
+        if ok and texto.strip() in ("", "[]"):
+            ok, _ = sdb.insert("budget", fila)
+        return ok
+
     # Función Callback para Guardado Automático
     def on_budget_edit():
         state_key = f"budget_editor_{anio_sel}"
         if state_key in st.session_state:
             cambios = st.session_state[state_key]
-            if cambios["edited_rows"] or cambios["added_rows"] or cambios["deleted_rows"]:
-                # 1. Obtener el DataFrame actual del estado del widget
-                df_base = df_budget_visual.copy()
-                for row_idx, changed_cols in cambios["edited_rows"].items():
-                    idx = int(row_idx)
-                    for col, val in changed_cols.items():
-                        df_base.loc[idx, col] = val
-                
-                # 2. Guardar usando Supabase
-                df_to_save = df_base[~df_base['Categoria'].isin(["📊 SALDO MES", "📈 SALDO ACUMULADO"])].copy()
-                
+            if cambios["edited_rows"]:
                 # Obtener mapeo de categorías para obtener IDs
-                cats_db = sdb.query("categories", select="id,name")
-                cat_to_id = dict(zip(cats_db['name'], cats_db['id']))
+                cat_to_id = ctx.cat_to_id
                 
-                for _, row in df_to_save.iterrows():
-                    cat_name = row['Categoria']
-                    cat_id = cat_to_id.get(cat_name)
+                # 1. Solo las celdas que realmente cambiaron (edited_rows: {fila: {periodo: valor}})
+                filas_upsert = []
+                for row_idx, changed_cols in cambios["edited_rows"].items():
+                    idx = int(row_idx)
+                    cat_id = cat_to_id.get(df_budget_visual.loc[idx, 'Categoria'])
                     if not cat_id: continue
                     
-                    for col in df_to_save.columns:
-                        if col == "Categoria": continue
-                        val = row[col]
-                        check = sdb.query("budget", filters={"category_id": f"eq.{cat_id}", "period": f"eq.{col}"})
-                        if not check.empty:
-                            sdb.update("budget", {"amount": val}, filters={"id": f"eq.{check.iloc[0]['id']}"})
-                        else:
-                            sdb.insert("budget", {"category_id": cat_id, "period": col, "amount": val})
+                    for col, val in changed_cols.items():
+                        val = 0 if val is None else val
+                        if val == df_budget_visual.loc[idx, col]: continue
+                        filas_upsert.append({"category_id": int(cat_id), "period": col, "amount": val})
                 
-                st.cache_data.clear()
-                st.toast("✅ Presupuesto guardado en la nube")
+                # 2. Un solo upsert masivo con clave (category_id, period)
+                if filas_upsert:
+                    ok_filas, msg = sdb.bulk_upsert("budget", filas_upsert, on_conflict="category_id,period")
+                    if NO_UNIQUE_KEY in msg and not any(ok_filas):
+                        # Base sin la clave única (category_id, period) de migrate_v3.sql: celda a celda
+                        ok_filas = [guardar_celda_presupuesto(f) for f in filas_upsert]
+                    fallidas = [f"{f['period']}" for f, ok in zip(filas_upsert, ok_filas) if not ok]
+                    if fallidas:
+                        st.toast(f"❌ No se guardaron {len(fallidas)} celdas ({', '.join(fallidas)}): {msg[:200]}")
+                    else:
+                        st.toast(f"✅ Presupuesto guardado en la nube ({len(filas_upsert)} celdas)")
 
     # Editor con on_change para estabilidad
     h_editor = (len(df_budget_visual) + 1) * 35 + 45
@@ -601,33 +513,11 @@ with tab_budget:
     # Eliminamos el bloque 'if not df_budget_edited.equals(df_budget_visual)' que causaba el bug
 
     # --- CÁLCULO DINÁMICO DE SALDOS (Después del editor) ---
-    # Creamos un DF "al aire" que combina el original con los cambios del editor para el cálculo
-    df_live = df_budget.copy()
-    df_live.set_index('Categoria', inplace=True)
-    df_edit_for_calc = df_budget_edited.set_index('Categoria')
-    df_live.update(df_edit_for_calc)
-    df_live.reset_index(inplace=True)
-
-    cats_ingreso = [c for c in df_live['Categoria'] if tipo_map.get(c) == 'Ingresos']
-    cats_gasto = [c for c in df_live['Categoria'] if c not in cats_ingreso]
-    
-    # Saldo Mensual
-    saldos_live = {}
-    for cl in cols_to_show[1:]:
-        ing = df_live[df_live['Categoria'].isin(cats_ingreso)][cl].sum()
-        gas = df_live[df_live['Categoria'].isin(cats_gasto)][cl].sum()
-        saldos_live[cl] = ing - gas
-    
-    # Saldo Acumulado
-    saldo_acum_live = {}
-    acum_live = 0
-    todos_meses = sorted([c for c in df_live.columns if c != "Categoria"])
-    for m in todos_meses:
-        ing_m = df_live[df_live['Categoria'].isin(cats_ingreso)][m].sum()
-        gas_m = df_live[df_live['Categoria'].isin(cats_gasto)][m].sum()
-        acum_live += (ing_m - gas_m)
-        if m in cols_to_show:
-            saldo_acum_live[m] = acum_live
+    # Matriz categoría x mes con signo por tipo; los valores del editor entran como overrides (sin copiar df_budget)
+    with span("presupuesto.saldos"):
+        saldos = BudgetEngine(df_budget, tipo_map).balances(overrides=df_budget_edited)
+    saldos_live = saldos['Saldo_Mes'].reindex(cols_to_show[1:]).to_dict()
+    saldo_acum_live = saldos['Saldo_Acumulado'].reindex(cols_to_show[1:]).to_dict()
 
     st.markdown("### Resumen de Saldos")
     
@@ -657,7 +547,8 @@ with tab_budget:
         }
     )
 
-with tab1:
+def vista_cargar_cartola(ctx):
+    """📥 Importación de cartolas con detección de duplicados y auto-categorización"""
     st.header("Carga de Datos")
     archivo = st.file_uploader("Arrastra tu cartola aquí (.xlsx o .csv)", type=["xlsx", "csv"])
     
@@ -665,56 +556,100 @@ with tab1:
         df_nuevo = procesar_archivo(archivo)
         
         if df_nuevo is not None:
+            # Duplicados contra lo ya guardado: una búsqueda hash por movimiento (exactos)
+            # y candidatos con el mismo monto y detalle a pocos días (posibles duplicados)
+            indice = get_fingerprint_index()
+            with span("cartola.duplicados", rows=len(df_nuevo)):
+                indice.sync(ctx.facts)
+                fechas_nuevas = pd.to_datetime(df_nuevo['Fecha'], format='%d-%m-%Y', errors='coerce')
+                sondeo = indice.probe(fechas_nuevas, df_nuevo['Detalle'], df_nuevo['Monto'], df_nuevo['Banco'])
+            es_exacto = sondeo['dup_id'].notna().to_numpy()
+            es_posible = (sondeo['near_ids'].str.len() > 0).to_numpy() & ~es_exacto
+
+            # Auto-categorización con lo aprendido de los movimientos ya conciliados
+            df_nuevo = df_nuevo.reset_index(drop=True)
+            confianza = None
+            if st.toggle("🤖 Auto-categorizar con lo aprendido", value=True):
+                with span("cartola.categorizar", rows=len(df_nuevo)):
+                    sugerencias = get_categorizer().sync(ctx.facts).predict(df_nuevo['Detalle'], df_nuevo['Monto'])
+                aplicar = (sugerencias['Confianza'] >= UMBRAL_AUTOCATEGORIA) & sugerencias['Categoria'].isin(ctx.cat_to_id)
+                df_nuevo.loc[aplicar, 'Categoria'] = sugerencias.loc[aplicar, 'Categoria']
+                confianza = sugerencias['Confianza'].where(aplicar)
+                if aplicar.any():
+                    st.info(f"🤖 {int(aplicar.sum())} de {len(df_nuevo)} movimientos categorizados automáticamente "
+                            f"(confianza ≥ {UMBRAL_AUTOCATEGORIA:.0%}).")
+
             st.write("### Vista previa de carga:")
-            st.dataframe(df_nuevo.head())
+            df_preview = df_nuevo.copy()
+            if confianza is not None:
+                df_preview['Confianza'] = confianza
+            df_preview['Duplicado'] = ''
+            df_preview.loc[es_exacto, 'Duplicado'] = 'Ya existe (id ' + sondeo.loc[es_exacto, 'dup_id'].astype('int64').astype(str) + ')'
+            df_preview.loc[es_posible, 'Duplicado'] = 'Posible (id ' + sondeo.loc[es_posible, 'near_ids'].map(
+                lambda ids: ', '.join(str(i) for i in ids)) + ')'
+            st.dataframe(df_preview.head())
+
+            omitir_exactos = omitir_posibles = False
+            if es_exacto.any() or es_posible.any():
+                st.warning(f"⚠️ {int(es_exacto.sum())} movimientos ya existen y {int(es_posible.sum())} "
+                           f"son posibles duplicados (mismo monto y detalle a ±{indice.near_days} días).")
+                st.dataframe(df_preview[df_preview['Duplicado'] != ''])
+                omitir_exactos = st.checkbox("Omitir duplicados exactos", value=True)
+                omitir_posibles = st.checkbox("Omitir también posibles duplicados", value=False)
+
+            omitir = (es_exacto & omitir_exactos) | (es_posible & omitir_posibles)
             
             if st.button("Confirmar e Insertar en Base de Datos"):
                 with st.spinner("Subiendo datos a la nube..."):
-                    # Obtener mapeo de categorías
-                    cats_db = sdb.query("categories", select="id,name")
-                    cat_to_id = dict(zip(cats_db['name'], cats_db['id']))
-                    
-                    data_to_insert = []
-                    for _, row in df_nuevo.iterrows():
-                        cat_name = row.get('Categoria', 'Pendiente')
-                        cat_id = cat_to_id.get(cat_name)
-                        
-                        # Estructura para Supabase
-                        data_to_insert.append({
-                            "date": row['Fecha_tmp'].strftime('%Y-%m-%d'),
-                            "period": get_accounting_month(row['Fecha_tmp']),
-                            "detail": row['Detalle'],
-                            "amount": row['Monto'],
-                            "bank": row['Banco'],
-                            "category_id": cat_id,
-                            "status": "Pendiente"
-                        })
+                    # Estructura para Supabase, vectorizada y con huella (fingerprint) por movimiento
+                    data_to_insert, n_invalidos = facts_insert_payloads(df_nuevo, ctx.cat_to_id, keep=~omitir)
+                    if n_invalidos:
+                        st.warning(f"⚠️ {n_invalidos} filas sin fecha válida no se subirán.")
+                    if omitir.any():
+                        st.info(f"ℹ️ {int(omitir.sum())} duplicados omitidos.")
                     
                     if data_to_insert:
-                        ok, msg = sdb.insert("facts", data_to_insert)
-                        if ok:
+                        # Bloques acotados en paralelo; on_conflict=fingerprint hace la re-importación idempotente
+                        resultado, msg = sdb.bulk_upsert(
+                            "facts", data_to_insert, on_conflict="fingerprint",
+                            chunk_size=500, max_workers=4, ignore_duplicates=True
+                        )
+                        if not any(resultado) and (NO_UNIQUE_KEY in msg or UNKNOWN_COLUMN in msg):
+                            # Base sin la columna/clave única fingerprint (ver migrate_v3.sql): inserción simple;
+                            # los duplicados exactos ya se omitieron con el índice de huellas
+                            if UNKNOWN_COLUMN in msg:
+                                data_to_insert = [{k: v for k, v in fila.items() if k != "fingerprint"} for fila in data_to_insert]
+                            resultado = []
+                            for inicio in range(0, len(data_to_insert), 500):
+                                lote = data_to_insert[inicio:inicio + 500]
+                                ok, msg = sdb.insert("facts", lote)
+                                resultado += [ok] * len(lote)
+                        n_nuevos = resultado.count(True)
+                        n_existentes = resultado.count(None)
+                        n_fallidos = resultado.count(False)
+                        if n_fallidos == 0:
                             st.balloons()
-                            st.success(f"✅ ¡Éxito! {len(data_to_insert)} movimientos subidos a la nube.")
-                            st.cache_data.clear()
+                            st.success(f"✅ ¡Éxito! {n_nuevos} movimientos subidos a la nube ({n_existentes} ya existían).")
                         else:
-                            st.error(f"❌ Error al subir datos: {msg}")
+                            st.error(f"❌ Error al subir {n_fallidos} movimientos ({n_nuevos} subidos, {n_existentes} ya existían): {msg}")
 
-with tab2:
+def vista_conciliacion(ctx):
+    """📊 Listado de movimientos filtrado en el servidor y guardado de la conciliación"""
     st.header("Listado de Movimientos")
     
-    df_cat = cargar_datos()
-    lista_categorias = cargar_categorias()
+    df_cat = ctx.facts
+    lista_categorias = ctx.categorias
     
     if not df_cat.empty:
-        # KPI de Pendientes
-        n_pendientes = df_cat[df_cat['Categoria'] == 'Pendiente'].shape[0]
+        # KPI de Pendientes y meses disponibles desde el cubo mensual (sin recorrer los movimientos)
+        cubo = get_monthly_cube()
+        with span("conciliacion.cubo", rows=len(df_cat)):
+            cubo.sync(df_cat, ctx.tipo_map)
+        n_pendientes = cubo.pending_count()
         if n_pendientes > 0:
             st.warning(f"🔔 Tienes **{n_pendientes}** movimientos pendientes de clasificar.")
         else:
             st.success("✅ ¡Felicidades! Todo está conciliado.")
-
-        # Asegurar formato de fecha para filtrado (Ya lo tenemos corregido en cargar_datos)
-        df_cat_proc = df_cat.copy()
         
         # Filtros
         col1, col2, col3, col4 = st.columns([1, 1.2, 1.2, 1.5])
@@ -722,8 +657,7 @@ with tab2:
             ver_pendientes = st.toggle("🔍 Solo Pendientes", value=True)
         with col2:
             # Filtro por Mes (USANDO LÓGICA CONTABLE PARA CONSISTENCIA)
-            df_cat_proc['Mes_Contable'] = df_cat_proc['Fecha_dt'].apply(get_accounting_month)
-            meses_disponibles = sorted(df_cat_proc['Mes_Contable'].dropna().unique().tolist(), reverse=True)
+            meses_disponibles = cubo.months()
             mes_filtrado = st.selectbox("📅 Mes Contable", ["Todos"] + meses_disponibles)
         with col3:
             # Filtro por Categoría
@@ -731,19 +665,75 @@ with tab2:
         with col4:
              filtro_detalle = st.text_input("🔎 Buscar en Detalle", placeholder="Ej: Supermercado")
 
-        # Aplicar filtros al dataframe que se mostrará
-        df_display = df_cat_proc.copy()
-        
-        if filtro_detalle:
-            df_display = df_display[df_display['Detalle'].astype(str).str.contains(filtro_detalle, case=False, na=False)]
+        # Los filtros se envían a PostgREST: solo viajan (y se parsean) las filas que se muestran
+        def consulta_filtrada():
+            consulta = sdb.table("facts").select(COLUMNAS_CONCILIACION)
+            if ver_pendientes:
+                id_pendiente = ctx.cat_to_id.get('Pendiente')
+                if id_pendiente is not None:
+                    consulta = consulta.or_("category_id.is.null", f"category_id.eq.{int(id_pendiente)}")
+                else:
+                    consulta = consulta.is_("category_id", None)
+            elif cat_filtrada != "Todas":
+                consulta = consulta.eq("category_id", int(ctx.cat_to_id.get(cat_filtrada, -1)))
 
-        if ver_pendientes:
-            df_display = df_display[df_display['Categoria'] == 'Pendiente']
-        elif cat_filtrada != "Todas":
-            df_display = df_display[df_display['Categoria'] == cat_filtrada]
-            
-        if mes_filtrado != "Todos":
-            df_display = df_display[df_display['Mes_Contable'] == mes_filtrado]
+            if mes_filtrado != "Todos":
+                # Mes contable como rango de fechas (la columna period no tiene un formato único)
+                desde, hasta = accounting_month_bounds(mes_filtrado)
+                consulta = consulta.gte("date", desde).lt("date", hasta)
+            return consulta
+
+        def ordenar(consulta):
+            return consulta.order("date", desc=True).order("id", desc=True).limit(LIMITE_CONCILIACION)
+
+        lotes_ids = None
+        if filtro_detalle:
+            # Texto: el índice local (sin tildes ni mayúsculas, en cualquier orden) resuelve los ids
+            indice_detalle = get_detail_index()
+            with span("conciliacion.busqueda"):
+                indice_detalle.sync(df_cat)
+                ids_encontrados = indice_detalle.search(filtro_detalle, substring=True)
+                # Los demás filtros también se resuelven en local (ctx.facts), sin consultar el servidor
+                encontrados = df_cat[df_cat['id'].isin(ids_encontrados)]
+                if ver_pendientes:
+                    encontrados = encontrados[encontrados['Categoria'] == 'Pendiente']
+                elif cat_filtrada != "Todas":
+                    encontrados = encontrados[encontrados['Categoria'] == cat_filtrada]
+                if mes_filtrado != "Todos":
+                    encontrados = encontrados[encontrados['Mes_Contable'] == mes_filtrado]
+                total_busqueda = len(encontrados)
+                # Solo los más recientes que se muestran, en lotes de ids que caben en la URL
+                ids_mostrar = encontrados.sort_values(['Fecha_dt', 'id'], ascending=False)['id'].head(
+                    LIMITE_CONCILIACION).tolist()
+            lotes_ids = [ids_mostrar[i:i + MAX_IDS_EN_FILTRO]
+                         for i in range(0, len(ids_mostrar), MAX_IDS_EN_FILTRO)]
+
+        with span("conciliacion.consulta") as traza:
+            if lotes_ids is None:
+                df_resultado = ordenar(consulta_filtrada()).execute()
+            else:
+                # Los lotes (a lo sumo LIMITE / MAX_IDS_EN_FILTRO) se piden en paralelo
+                def traer_lote(lote):
+                    return ordenar(consulta_filtrada().in_("id", lote)).execute(raise_errors=True)
+
+                partes = []
+                if lotes_ids:
+                    try:
+                        with ThreadPoolExecutor(max_workers=len(lotes_ids)) as pool:
+                            partes = list(pool.map(propagate(traer_lote), lotes_ids))
+                    except Exception as e:
+                        st.error(f"Error al consultar movimientos: {e}")
+                partes = [p for p in partes if not p.empty]
+                df_resultado = (pd.concat(partes, ignore_index=True)
+                                .sort_values(['date', 'id'], ascending=False)
+                                .reset_index(drop=True) if partes else pd.DataFrame())
+            df_display = normalizar_facts(df_resultado)
+            if traza:
+                traza.set(rows=len(df_display))
+        if len(df_display) >= LIMITE_CONCILIACION:
+            total = consulta_filtrada().count() if lotes_ids is None else total_busqueda
+            st.caption(f"Mostrando los {LIMITE_CONCILIACION} movimientos más recientes de {total}. "
+                       "Usa los filtros para acotar la vista.")
 
         # Identificar duplicados visualmente
         df_display['Duplicado'] = df_display.duplicated(subset=['Fecha', 'Detalle', 'Monto'], keep=False)
@@ -773,61 +763,73 @@ with tab2:
             key="conciliacion_editor"
         )
         
-        if st.button("💾 Guardar Cambios Finales", type="primary"):
+        col_guardar, col_auto = st.columns([1, 1])
+        with col_auto:
+            auto_conciliar = st.button("🤖 Auto-conciliar pendientes",
+                                       help=f"Aplica la categoría sugerida a los pendientes con confianza ≥ {UMBRAL_AUTOCATEGORIA:.0%}")
+        if auto_conciliar:
+            with st.spinner("Categorizando pendientes..."):
+                pendientes = df_cat[df_cat['Categoria'] == 'Pendiente']
+                sugerencias = get_categorizer().sync(df_cat).predict(pendientes['Detalle'], pendientes['Monto'])
+                seguros = ((sugerencias['Confianza'] >= UMBRAL_AUTOCATEGORIA)
+                           & sugerencias['Categoria'].isin(ctx.cat_to_id)).to_numpy()
+                # ctx.facts solo guarda Fecha_dt: la fecha de texto se deriva para el subconjunto a guardar
+                df_auto = pendientes.loc[seguros, ['id', 'Detalle', 'Monto', 'Banco']].assign(
+                    Fecha=pendientes.loc[seguros, 'Fecha_dt'].dt.strftime('%Y-%m-%d'),
+                    Categoria=sugerencias.loc[seguros, 'Categoria'].to_numpy())
+                payloads, ids_invalidos = facts_update_payloads(df_auto, ctx.cat_to_id, pendientes.loc[seguros, 'Fecha_dt'])
+                ok_filas, msg = sdb.bulk_upsert("facts", payloads, on_conflict="id", chunk_size=500)
+                resumen = f"🤖 Se auto-conciliaron {sum(ok_filas)} de {len(pendientes)} movimientos pendientes."
+                n_fallidos = len(ok_filas) - sum(ok_filas) + len(ids_invalidos)
+                if n_fallidos:
+                    resumen += f" ❌ {n_fallidos} no se pudieron guardar. {msg[:200]}"
+                st.session_state["resultado_conciliacion"] = resumen
+                st.rerun()
+
+        if col_guardar.button("💾 Guardar Cambios Finales", type="primary"):
             with st.spinner("Actualizando base de datos central..."):
-                # Obtenemos mapeo de categorías
-                cats_db = sdb.query("categories", select="id,name")
-                cat_to_id = dict(zip(cats_db['name'], cats_db['id']))
-                
                 # En el data_editor de Streamlit, editamos el DF filtrado.
-                # Pero df_editado tiene los valores actuales.
-                # Lo más eficiente es iterar sobre el editor y parchear por ID.
-                n_updates = 0
-                for idx, row in df_editado.iterrows():
-                    # Solo actualizamos si tiene ID (los nuevos se manejan distinto, pero aquí son solo cambios)
-                    if 'id' in row and not pd.isna(row['id']):
-                        cat_id = cat_to_id.get(row['Categoria'])
-                        payload = {
-                            "category_id": cat_id,
-                            "detail": row['Detalle'],
-                            "amount": row['Monto'],
-                            "status": "Conciliado" # Si lo editó en esta tabla, lo marcamos como conciliado
-                        }
-                        # Intentar parsear fecha si fue cambiada
-                        try:
-                            dt = pd.to_datetime(row['Fecha'], dayfirst=True)
-                            payload["date"] = dt.strftime('%Y-%m-%d')
-                            payload["period"] = get_accounting_month(dt)
-                        except:
-                            pass
-                        
-                        ok, _ = sdb.update("facts", payload, filters={"id": f"eq.{row['id']}"})
-                        if ok: n_updates += 1
+                # Solo enviamos las filas que cambiaron respecto a lo mostrado (diff por ID);
+                # las nuevas sin ID se ignoran, igual que antes.
+                df_cambiados = changed_rows(df_editor_input, df_editado, key='id',
+                                            columns=['Fecha', 'Detalle', 'Monto', 'Categoria'])
+                n_sin_cambios = int(df_editado['id'].notna().sum()) - len(df_cambiados)
+                
+                # Payloads vectorizados (si la fecha editada no se entiende, se mantiene la original)
+                fechas_originales = df_cambiados['id'].map(df_display.set_index('id')['Fecha_dt'])
+                payloads, ids_invalidos = facts_update_payloads(df_cambiados, ctx.cat_to_id, fechas_originales)
                 
-                st.success(f"✅ Se actualizaron {n_updates} movimientos en la nube.")
-                st.cache_data.clear()
+                # Un upsert masivo por id (en bloques) en vez de un PATCH por fila
+                ok_filas, msg = sdb.bulk_upsert("facts", payloads, on_conflict="id", chunk_size=500)
+                n_updates = sum(ok_filas)
+                n_fallidos = len(ok_filas) - n_updates + len(ids_invalidos)
+                
+                resumen = f"✅ Se actualizaron {n_updates} movimientos en la nube ({n_sin_cambios} sin cambios)."
+                if n_fallidos:
+                    resumen += f" ❌ {n_fallidos} no se pudieron guardar. {msg[:200]}"
+                st.session_state["resultado_conciliacion"] = resumen
                 st.rerun()
+        
+        if "resultado_conciliacion" in st.session_state:
+            st.info(st.session_state.pop("resultado_conciliacion"))
     else:
         st.info("Bandeja de entrada vacía.")
 
-with tab3:
+def vista_configuracion(ctx):
+    """⚙️ Gestión de categorías"""
     st.header("⚙️ Gestión de Categorías")
     st.write("Agrega, edita o elimina las categorías de tu presupuesto. Los cambios se sincronizarán con la nube.")
     
-    # Cargar categorías incluyendo el ID para actualizaciones estables
-    with st.spinner("Leyendo base de datos..."):
-        df_config = sdb.query("categories")
-    
-    if df_config.empty:
-        df_config = pd.DataFrame(columns=['id', 'name', 'type', 'grouper'])
+    # Categorías incluyendo el ID para actualizaciones estables (desde el contexto del rerun)
+    df_config = ctx.cat_map
+    if 'id' not in df_config.columns:
+        df_config = pd.DataFrame(columns=['id', 'Categoria', 'Tipo', 'Agrupador'])
     
     # Editor de Datos Limpio
     # Renombramos solo para la vista
     df_config_view = df_config.rename(columns={
         'id': 'ID',
-        'name': 'Nombre',
-        'type': 'Tipo',
-        'grouper': 'Agrupador'
+        'Categoria': 'Nombre'
     })
     
     # Columnas a editar
@@ -872,7 +874,50 @@ with tab3:
                 ok, msg = sdb.upsert("categories", data_to_sync, on_conflict="id")
                 if ok:
                     st.success("✅ Categorías actualizadas correctamente.")
-                    st.cache_data.clear()
                     st.rerun()
                 else:
                     st.error(f"❌ Error al guardar: {msg}")
+
+    # Panel oculto: aparece al abrir la app con ?perf=1 (o mientras las trazas estén activas)
+    if st.query_params.get("perf") == "1" or tracer.enabled:
+        panel_rendimiento(tracer)
+
+def panel_rendimiento(tracer):
+    """⚙️ Trazas de la sesión: llamadas a Supabase (red y JSON), cargas, procesamiento y vistas"""
+    with st.expander("⚙️ Performance", expanded=tracer.enabled):
+        def on_toggle():
+            tracer.enabled = st.session_state["perf_activo"]
+
+        st.toggle("Registrar trazas", value=tracer.enabled, key="perf_activo", on_change=on_toggle)
+        if not tracer.runs:
+            st.caption("Sin trazas registradas. Actívalas y navega por la app para medir cada rerun.")
+            return
+
+        # El rerun en curso aún se está midiendo: se muestra el último completo
+        if len(tracer.runs) >= 2:
+            previo = tracer.runs[-2]
+            st.markdown(f"**Último rerun** · {previo['label']} · {previo['started_at']}")
+            st.dataframe(tracer.run_summary(-2), hide_index=True, use_container_width=True)
+        st.markdown("**Acumulado de la sesión**")
+        st.dataframe(tracer.session_summary(), hide_index=True, use_container_width=True)
+
+        col_exportar, col_reiniciar = st.columns(2)
+        col_exportar.download_button(
+            "⬇️ Exportar traza (Chrome / Perfetto)", tracer.export(),
+            file_name=f"traza_{datetime.now():%Y%m%d_%H%M%S}.json", mime="application/json",
+        )
+        if col_reiniciar.button("🗑️ Reiniciar trazas"):
+            tracer.reset()
+            st.rerun()
+
+VISTAS = {
+    "🏠 Home / Resumen": vista_home,
+    "💰 Presupuesto": vista_presupuesto,
+    "📥 Cargar Cartola": vista_cargar_cartola,
+    "📊 Conciliación y Categorías": vista_conciliacion,
+    "⚙️ Configuración": vista_configuracion,
+}
+
+vista_activa = st.radio("Vista", list(VISTAS), horizontal=True, label_visibility="collapsed", key="vista_activa")
+with span(VISTAS[vista_activa].__name__):
+    VISTAS[vista_activa](ctx)
@@ -0,0 +1,49 @@
+import re
+
+from utils.payloads import fingerprint_backfill_payloads
+from utils.supabase_client import SupabaseDB
+
+# Stores a fingerprint on facts created without one (migrate_v2.py, older imports).
+# Run after migrate_v3.sql, which adds the facts.fingerprint column and its unique key.
+
+# 1. Load Secrets
+url = ""
+key = ""
+
+try:
+    with open(".streamlit/secrets.toml", "r") as f:
+        content = f.read()
+        url_match = re.search(r'url\s*=\s*"(.*?)"', content)
+        key_match = re.search(r'key\s*=\s*"(.*?)"', content)
+
+        if url_match: url = url_match.group(1)
+        if key_match: key = key_match.group(1)
+
+except Exception as e:
+    print(f"Error reading secrets: {e}")
+    exit(1)
+
+sdb = SupabaseDB(url, key)
+
+# 2. Read every fact (paged)
+print("--- Reading facts ---")
+facts = sdb.query_all("facts", select="id,date,period,detail,amount,bank,category_id,status,fingerprint",
+                      use_cache=False, raise_errors=True)
+print(f"Facts in DB: {len(facts)}")
+
+# 3. Fingerprint the rows that lack one
+if facts.empty:
+    print("Nothing to backfill.")
+    exit(0)
+
+payloads, n_conflicts = fingerprint_backfill_payloads(facts)
+if n_conflicts:
+    print(f"Warning: {n_conflicts} facts duplicate a fingerprinted movement and keep no fingerprint.")
+
+ok_rows, msg = sdb.bulk_upsert("facts", payloads, on_conflict="id", chunk_size=500, max_workers=4)
+n_failed = ok_rows.count(False)
+if n_failed:
+    print(f"Backfill error ({n_failed} facts not updated): {msg[:500]}")
+print(f"Fingerprints stored: {ok_rows.count(True)}")
+
+print("\n--- BACKFILL COMPLETE ---")
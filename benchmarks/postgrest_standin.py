@@ -0,0 +1,330 @@
+import json
+import re
+import threading
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlparse
+
+import numpy as np
+import pandas as pd
+
+# Embedded resources in select= (e.g. "*,categories(name)") and the foreign key that joins them
+EMBED_KEYS = {"categories": "category_id"}
+# Query parameters that are not row filters
+RESERVED_PARAMS = {"select", "order", "limit", "offset", "on_conflict", "columns"}
+# PostgREST caps every response at this many rows
+MAX_ROWS = 1000
+
+_SPLIT_RE = re.compile(r",(?![^(]*\))")
+
+
+def _split(text):
+    """Splits on commas that are not inside parentheses."""
+    return [part for part in _SPLIT_RE.split(text) if part]
+
+
+class LocalPostgREST:
+    """
+    In-process HTTP stand-in for the subset of PostgREST that SupabaseDB uses.
+
+    Tables live in memory as DataFrames in the server layout and every
+    request is answered over a real socket, so the client pays for HTTP,
+    JSON and paging just as it does against Supabase, minus the network.
+
+    Supported:
+
+    - GET with select (columns, '*', and embedded categories(name)),
+      filters eq/neq/gt/gte/lt/lte/is/in/like/ilike plus or=(...) and
+      and=(...), multi-key order, limit/offset (capped at MAX_ROWS) and
+      'Prefer: count=exact' reported in Content-Range.
+    - POST inserts and upserts (on_conflict with merge-duplicates or
+      ignore-duplicates), returning the representation.
+    - PATCH and DELETE with filters.
+
+    Writes bump updated_at, so FactsSync delta reads see them. The filtered
+    and sorted result of the last query per table is kept, so reading a
+    large table page by page does not re-filter it on every page.
+
+    Args:
+        tables: dict of table name -> DataFrame (each with an 'id' column).
+    """
+
+    def __init__(self, tables):
+        self.tables = {name: df.reset_index(drop=True) for name, df in tables.items()}
+        self._versions = {name: 0 for name in self.tables}
+        self._results = {}      # table -> (version, query key, filtered and sorted frame)
+        self._lock = threading.RLock()
+        self._server = None
+        self.stats = {"requests": 0, "bytes_sent": 0, "rows_sent": 0, "rows_written": 0}
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    @property
+    def url(self):
+        """Base URL to give SupabaseDB (it appends /rest/v1)."""
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        """Starts serving on a free local port in a daemon thread; returns the base URL."""
+        standin = self
+
+        class Handler(_Handler):
+            server_state = standin
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self.url
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    # --- Filters ---
+
+    def _mask(self, df, column, predicate):
+        op, _, value = predicate.partition(".")
+        if op == "not":
+            return ~self._mask(df, column, value)
+        if column in ("or", "and"):
+            masks = [self._condition(df, part) for part in _split(predicate[1:-1])]
+            combine = np.logical_or if column == "or" else np.logical_and
+            return combine.reduce(masks) if masks else np.ones(len(df), dtype=bool)
+        series = df[column] if column in df.columns else pd.Series(None, index=df.index, dtype=object)
+        numeric = pd.api.types.is_numeric_dtype(series.dtype)
+
+        def cast(v):
+            return float(v) if numeric else v
+
+        if op == "is":
+            if value == "null":
+                return series.isna().to_numpy()
+            return (series == (value == "true")).fillna(False).to_numpy(dtype=bool)
+        if op == "in":
+            values = [cast(v.strip('"')) for v in _split(value[1:-1])]
+            return series.isin(values).to_numpy()
+        if op in ("like", "ilike"):
+            pattern = "^" + ".*".join(re.escape(p) for p in value.replace("%", "*").split("*")) + "$"
+            codes, uniques = pd.factorize(series.astype(object).where(series.notna(), ""))
+            hits = pd.Index(uniques.astype(str)).str.contains(pattern, case=op == "like", regex=True)
+            return np.asarray(hits)[codes] if len(codes) else np.zeros(0, dtype=bool)
+        compare = {"eq": "eq", "neq": "ne", "gt": "gt", "gte": "ge", "lt": "lt", "lte": "le"}[op]
+        return getattr(series, compare)(cast(value)).fillna(op == "neq").to_numpy(dtype=bool)
+
+    def _condition(self, df, text):
+        """Mask for one 'column.op.value' term of or=/and= (nested or/and allowed)."""
+        for logic in ("or", "and"):
+            if text.startswith(logic + "("):
+                return self._mask(df, logic, text[len(logic):])
+        column, _, predicate = text.partition(".")
+        return self._mask(df, column, predicate)
+
+    def _select(self, table, params):
+        """Filtered and sorted rows for a GET, reusing the last result of the same query."""
+        filters = [(k, v) for k, v in params if k not in RESERVED_PARAMS]
+        order = dict(params).get("order", "")
+        key = (tuple(filters), order)
+        version = self._versions[table]
+        cached = self._results.get(table)
+        if cached is not None and cached[0] == version and cached[1] == key:
+            return cached[2]
+
+        df = self.tables[table]
+        if filters:
+            mask = np.ones(len(df), dtype=bool)
+            for column, predicate in filters:
+                mask &= self._mask(df, column, predicate)
+            df = df[mask]
+        if order:
+            columns, ascending = [], []
+            for term in order.split(","):
+                column, _, direction = term.partition(".")
+                columns.append(column)
+                ascending.append(not direction.startswith("desc"))
+            df = df.sort_values(columns, ascending=ascending, kind="stable")
+        self._results[table] = (version, key, df)
+        return df
+
+    def _project(self, page, select):
+        """Applies select= to a page: plain columns, '*' and embedded resources."""
+        out = pd.DataFrame(index=page.index)
+        for field in _split(select):
+            if field == "*":
+                out = page.copy()
+            elif "(" in field:
+                name, _, inner = field.partition("(")
+                columns = inner.rstrip(")").split(",")
+                embedded = self.tables[name].set_index("id")
+                lookup = {
+                    fk: {c: row[c] for c in columns}
+                    for fk, row in embedded[columns].to_dict("index").items()
+                }
+                out[name] = page[EMBED_KEYS[name]].map(lookup)
+            else:
+                out[field] = page[field]
+        return out
+
+    # --- Requests ---
+
+    def get(self, table, params, prefer):
+        with self._lock:
+            rows = self._select(table, params)
+            query = dict(params)
+            offset = int(query.get("offset", 0))
+            limit = min(int(query.get("limit", MAX_ROWS)), MAX_ROWS)
+            page = rows.iloc[offset:offset + limit]
+            body = self._project(page, query.get("select", "*"))
+            total = str(len(rows)) if "count=exact" in prefer else "*"
+        end = offset + len(page) - 1
+        content_range = f"{offset}-{end}/{total}" if len(page) else f"*/{total}"
+        self.stats["rows_sent"] += len(page)
+        return 200, body.to_json(orient="records", force_ascii=False), {"Content-Range": content_range}
+
+    def post(self, table, params, prefer, rows):
+        rows = rows if isinstance(rows, list) else [rows]
+        incoming = pd.DataFrame(rows)
+        with self._lock:
+            df = self.tables[table]
+            query = dict(params)
+            conflict_keys = query.get("on_conflict", "id").split(",")
+            resolution = "ignore" if "ignore-duplicates" in prefer else (
+                "merge" if "merge-duplicates" in prefer else None)
+
+            positions = np.full(len(incoming), -1)
+            if resolution and all(k in incoming.columns for k in conflict_keys):
+                existing = pd.MultiIndex.from_frame(df[conflict_keys].astype(str))
+                wanted = pd.MultiIndex.from_frame(incoming[conflict_keys].astype(str))
+                if existing.is_unique:
+                    positions = existing.get_indexer(wanted)
+                known = incoming[conflict_keys].notna().all(axis=1).to_numpy()
+                positions = np.where(known, positions, -1)
+            elif not resolution and "id" in incoming.columns:
+                if incoming["id"].isin(df["id"]).any():
+                    return 409, json.dumps({"message": "duplicate key value violates unique constraint"}), {}
+
+            updated = pd.DataFrame()
+            hit = positions >= 0
+            if hit.any() and resolution == "merge":
+                targets = df.index[positions[hit]]
+                changes = incoming[hit]
+                for column in changes.columns:
+                    if column not in df.columns:
+                        df[column] = None
+                    df.loc[targets, column] = changes[column].to_numpy()
+                self._stamp_rows(df, targets)
+                updated = df.loc[targets]
+
+            new = incoming[~hit].copy()
+            if not new.empty:
+                next_id = int(df["id"].max()) + 1 if len(df) else 1
+                if "id" not in new.columns:
+                    new["id"] = np.nan
+                missing_id = new["id"].isna().to_numpy()
+                new.loc[missing_id, "id"] = np.arange(next_id, next_id + missing_id.sum())
+                new["id"] = new["id"].astype("int64")
+                if "updated_at" in df.columns:
+                    new["updated_at"] = datetime.now(timezone.utc).isoformat()
+                df = pd.concat([df, new], ignore_index=True)
+                self.tables[table] = df
+
+            self._versions[table] += 1
+            self.stats["rows_written"] += len(new) + len(updated)
+            returned = pd.concat([updated, new], ignore_index=True) if len(updated) else new
+            body = returned.reindex(columns=df.columns).to_json(orient="records", force_ascii=False)
+        return 201, body, {}
+
+    def _stamp_rows(self, df, index):
+        if "updated_at" in df.columns:
+            df.loc[index, "updated_at"] = datetime.now(timezone.utc).isoformat()
+
+    def patch(self, table, params, prefer, changes):
+        with self._lock:
+            df = self.tables[table]
+            mask = self._filter_mask(df, params)
+            for column, value in changes.items():
+                if column not in df.columns:
+                    df[column] = None
+                df.loc[mask, column] = value
+            self._stamp_rows(df, df.index[mask])
+            self._versions[table] += 1
+            self.stats["rows_written"] += int(mask.sum())
+            body = df[mask].to_json(orient="records", force_ascii=False)
+        return 200, body, {}
+
+    def delete(self, table, params, prefer):
+        with self._lock:
+            df = self.tables[table]
+            mask = self._filter_mask(df, params)
+            body = df[mask].to_json(orient="records", force_ascii=False)
+            self.tables[table] = df[~mask].reset_index(drop=True)
+            self._versions[table] += 1
+        return 200, body, {}
+
+    def _filter_mask(self, df, params):
+        mask = np.ones(len(df), dtype=bool)
+        for column, predicate in params:
+            if column not in RESERVED_PARAMS:
+                mask &= self._mask(df, column, predicate)
+        return mask
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_state = None
+
+    def log_message(self, *args):
+        pass
+
+    def _route(self):
+        url = urlparse(self.path)
+        table = url.path.rstrip("/").split("/")[-1]
+        return table, parse_qsl(url.query, keep_blank_values=True)
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"null")
+
+    def _reply(self, status, body, headers):
+        data = body.encode("utf-8")
+        state = self.server_state
+        state.stats["requests"] += 1
+        state.stats["bytes_sent"] += len(data)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _dispatch(self, method, with_body=False):
+        table, params = self._route()
+        state = self.server_state
+        if table not in state.tables:
+            return self._reply(404, json.dumps({"message": f"relation {table} does not exist"}), {})
+        prefer = self.headers.get("Prefer", "")
+        args = (table, params, prefer) + ((self._body(),) if with_body else ())
+        try:
+            self._reply(*getattr(state, method)(*args))
+        except (KeyError, ValueError, TypeError) as e:
+            self._reply(400, json.dumps({"message": f"{type(e).__name__}: {e}"}), {})
+
+    def do_GET(self):
+        self._dispatch("get")
+
+    def do_POST(self):
+        self._dispatch("post", with_body=True)
+
+    def do_PATCH(self):
+        self._dispatch("patch", with_body=True)
+
+    def do_DELETE(self):
+        self._dispatch("delete")
@@ -0,0 +1,292 @@
+"""
+Benchmarks of the app's hot paths against synthetic ledgers.
+
+Every run generates the same tables for a given seed, serves them from an
+in-process PostgREST stand-in (benchmarks.postgrest_standin) and times the
+load, import, home aggregation and save paths at each size. Results are
+written as JSON so two runs can be compared:
+
+    python -m benchmarks.run --sizes 1000 10000 100000 --output benchmarks/results/base.json
+    python -m benchmarks.run --sizes 1000 10000 100000 --baseline benchmarks/results/base.json
+
+With --baseline, cases whose median got slower than the tolerance are
+listed and the exit code is 1.
+
+procesar_archivo in app.py is a thin wrapper over read_cartola, which is
+what the procesar_archivo_* cases time (importing app.py would render it).
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.postgrest_standin import LocalPostgREST
+from benchmarks.synthetic import (
+    CARTOLA_MAX_ROWS, SIZES, cartola_frame, generate_ledger, generic_csv, santander_xlsx,
+)
+from utils.aggregates import MonthlyCube
+from utils.budget import BudgetEngine, budget_vs_actual
+from utils.cartola_parsers import normalizar_dataframe_import, read_cartola
+from utils.data_context import (
+    cargar_categorias, cargar_datos, cargar_presupuesto, lista_categorias, preparar_facts,
+)
+from utils.facts_sync import FactsSync
+from utils.payloads import changed_rows, facts_insert_payloads, facts_update_payloads
+from utils.supabase_client import SupabaseDB
+
+RESULTS_SCHEMA = 1
+DEFAULT_SIZES = SIZES[:3]
+# Rows saved per import / per conciliation save (what the app sends in one click)
+IMPORT_ROWS = 5_000
+CONCILIATION_ROWS = 1_000
+# Budget editor: every cell of one year is edited (a yearly plan typed in or pasted)
+BUDGET_MONTHS = 12
+
+
+class Case:
+    """
+    One timed operation at one ledger size.
+
+    Args:
+        name: Stable identifier used to match results across runs.
+        run: Callable timed on every repeat; receives the output of setup.
+        setup: Optional untimed callable run before every repeat.
+        rows: Rows processed per repeat (for rows/s).
+    """
+
+    def __init__(self, name, run, setup=None, rows=None):
+        self.name = name
+        self.run = run
+        self.setup = setup
+        self.rows = rows
+
+    def measure(self, repeat):
+        times = []
+        for _ in range(repeat):
+            arg = self.setup() if self.setup else None
+            start = time.perf_counter()
+            self.run(arg) if self.setup else self.run()
+            times.append(time.perf_counter() - start)
+        return times
+
+
+def _client(standin):
+    return SupabaseDB(standin.url, "benchmark")
+
+
+def _import_frame(n_rows, seed):
+    raw = cartola_frame(n_rows, seed=seed)
+    return pd.DataFrame({
+        'Fecha': raw['Fecha'],
+        'Detalle': raw['Detalle'],
+        'Monto': raw['Monto abono ($)'] - raw['Monto cargo ($)'],
+        'Banco': 'CC Santander',
+        'Categoria': 'Pendiente',
+    })
+
+
+def build_cases(standin, ledger, n_facts):
+    """The benchmark cases for one ledger served by standin."""
+    sdb = _client(standin)
+    facts = cargar_datos(sdb)
+    df_cat = cargar_categorias(sdb, full=True)
+    tipo_map = dict(zip(df_cat['Categoria'], df_cat['Tipo']))
+    cat_to_id = dict(zip(df_cat['Categoria'], df_cat['id']))
+    categorias = lista_categorias(df_cat)
+    budget = cargar_presupuesto(sdb, categorias)
+    latest_month = max(facts['Mes_Contable'].dropna())
+
+    n_cartola = min(n_facts, CARTOLA_MAX_ROWS)
+    statement = cartola_frame(n_cartola)
+    xlsx, csv = santander_xlsx(statement), generic_csv(statement)
+    import_raw = _import_frame(n_cartola, seed=0)
+
+    def home(cube):
+        cube.sync(facts, tipo_map)
+        totals = cube.month_totals(latest_month)
+        table = budget_vs_actual(cube.by_category(latest_month), budget, latest_month, tipo_map)
+        return totals, table, BudgetEngine(budget, tipo_map).net_for(latest_month)
+
+    warm_cube = MonthlyCube()
+    warm_cube.sync(facts, tipo_map)
+
+    sync = FactsSync(_client(standin), min_interval=0, transform=preparar_facts)
+    sync.refresh()
+
+    def touch_one_fact():
+        fact_id = int(np.random.default_rng().integers(1, n_facts + 1))
+        sync.sdb.bulk_upsert("facts", [{"id": fact_id, "status": "Conciliado"}], on_conflict="id")
+
+    import_seed = iter(range(1, 1_000_000))
+    n_import = min(n_facts, IMPORT_ROWS)
+
+    def import_batch():
+        return normalizar_dataframe_import(_import_frame(n_import, seed=next(import_seed)))
+
+    def save_import(df):
+        payloads, _ = facts_insert_payloads(df, cat_to_id)
+        return sdb.bulk_upsert("facts", payloads, on_conflict="fingerprint", chunk_size=500,
+                               max_workers=4, ignore_duplicates=True)
+
+    pendientes = facts[facts['Categoria'] == 'Pendiente'].head(CONCILIATION_ROWS)
+    editor_input = pd.DataFrame({
+        'id': pendientes['id'].to_numpy(),
+        'Fecha': pendientes['Fecha_dt'].dt.strftime('%Y-%m-%d').to_numpy(),
+        'Detalle': pendientes['Detalle'].to_numpy(),
+        'Monto': pendientes['Monto'].to_numpy(),
+        'Banco': pendientes['Banco'].astype(object).to_numpy(),
+        'Categoria': pendientes['Categoria'].astype(object).to_numpy(),
+    })
+    edited = editor_input.assign(Categoria='Supermercado')
+
+    def save_conciliation():
+        changed = changed_rows(editor_input, edited, key='id', columns=['Fecha', 'Detalle', 'Monto', 'Categoria'])
+        payloads, _ = facts_update_payloads(changed, cat_to_id)
+        return sdb.bulk_upsert("facts", payloads, on_conflict="id", chunk_size=500)
+
+    # The year shown in the editor: months already budgeted are updated, the rest inserted
+    budget_year = max(ledger["budget"]["period"])[:4]
+    budget_cells = [(int(cid), f"{budget_year}-{month:02d}")
+                    for cid in cat_to_id.values() for month in range(1, BUDGET_MONTHS + 1)]
+    budget_round = iter(range(1, 1_000_000))
+
+    def edited_budget_cells():
+        amount = next(budget_round) * 10_000
+        return [{"category_id": cid, "period": period, "amount": amount} for cid, period in budget_cells]
+
+    def save_budget(filas):
+        return sdb.bulk_upsert("budget", filas, on_conflict="category_id,period")
+
+    return [
+        Case("cargar_datos", lambda: cargar_datos(_client(standin)), rows=n_facts),
+        Case("cargar_datos_delta", lambda _: sync.refresh(), setup=touch_one_fact, rows=1),
+        Case("cargar_presupuesto", lambda: cargar_presupuesto(_client(standin), categorias), rows=len(ledger["budget"])),
+        Case("normalizar_dataframe_import", normalizar_dataframe_import,
+             setup=lambda: import_raw.copy(), rows=n_cartola),
+        Case("procesar_archivo_xlsx", lambda: read_cartola(io.BytesIO(xlsx), "cartola.xlsx"), rows=n_cartola),
+        Case("procesar_archivo_csv", lambda: read_cartola(io.BytesIO(csv), "cartola.csv"), rows=n_cartola),
+        Case("home_agregacion", lambda: home(MonthlyCube()), rows=n_facts),
+        Case("home_agregacion_rerun", lambda: home(warm_cube), rows=n_facts),
+        Case("guardar_importacion", save_import, setup=import_batch, rows=n_import),
+        Case("guardar_conciliacion", save_conciliation, rows=len(editor_input)),
+        Case("guardar_presupuesto", save_budget, setup=edited_budget_cells, rows=len(budget_cells)),
+    ]
+
+
+def _log(message):
+    print(message, file=sys.stderr)
+
+
+def run(sizes, repeat=3, seed=0, only=None, log=_log):
+    """Runs every case at every size; returns the list of result dicts."""
+    results = []
+    for n_facts in sizes:
+        start = time.perf_counter()
+        ledger = generate_ledger(n_facts, seed=seed)
+        log(f"[{n_facts:>9,} filas] ledger sintético en {time.perf_counter() - start:.1f}s")
+        with LocalPostgREST(ledger) as standin:
+            for case in build_cases(standin, ledger, n_facts):
+                if only and case.name not in only:
+                    continue
+                requests_before = standin.stats["requests"]
+                times = case.measure(repeat)
+                median = statistics.median(times)
+                result = {
+                    "name": case.name,
+                    "size": n_facts,
+                    "rows": case.rows,
+                    "repeat": repeat,
+                    "min_s": min(times),
+                    "median_s": median,
+                    "mean_s": statistics.fmean(times),
+                    "rows_per_s": case.rows / median if case.rows and median else None,
+                    "requests": (standin.stats["requests"] - requests_before) / repeat,
+                }
+                results.append(result)
+                log(f"  {case.name:<30} {median * 1000:>10.1f} ms  ({result['requests']:.0f} requests)")
+    return results
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, tolerance, min_delta=0.005):
+    """
+    Cases whose median is slower than baseline by more than tolerance
+    (e.g. 0.25 = 25%) and by at least min_delta seconds, so millisecond
+    jitter on the fastest cases is not reported.
+    """
+    previous = {(r["name"], r["size"]): r for r in baseline["results"]}
+    regressions = []
+    for result in results:
+        old = previous.get((result["name"], result["size"]))
+        if old and old["median_s"] > 0:
+            ratio = result["median_s"] / old["median_s"]
+            if ratio > 1 + tolerance and result["median_s"] - old["median_s"] >= min_delta:
+                regressions.append({**result, "baseline_median_s": old["median_s"], "ratio": ratio})
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES,
+                        help=f"ledger sizes (default {DEFAULT_SIZES}; 1000000 is supported but slow)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--only", nargs="+", help="run only these case names")
+    parser.add_argument("--output", help="write the JSON results to this file")
+    parser.add_argument("--baseline", help="JSON results of a previous run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="allowed slowdown before a case counts as a regression (default 0.25)")
+    args = parser.parse_args(argv)
+
+    results = run(args.sizes, repeat=args.repeat, seed=args.seed, only=args.only)
+    report = {
+        "schema": RESULTS_SCHEMA,
+        "meta": {
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "seed": args.seed,
+        },
+        "results": results,
+    }
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Resultados en {args.output}")
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for r in regressions:
+            print(f"REGRESIÓN {r['name']} @ {r['size']:,}: {r['baseline_median_s'] * 1000:.1f} ms -> "
+                  f"{r['median_s'] * 1000:.1f} ms (x{r['ratio']:.2f})")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
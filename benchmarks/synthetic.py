@@ -0,0 +1,185 @@
+import io
+from datetime import date
+
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook
+
+from utils.cartola_parsers import SantanderParser
+from utils.date_utils import ACCOUNTING_CUTOFF_DAY, get_accounting_months
+
+# (name, type, grouper) of the synthetic category dimension
+CATEGORIES = [
+    ("Sueldo", "Ingresos", "Ingresos"),
+    ("Transferencias recibidas", "Ingresos", "Ingresos"),
+    ("Arriendo", "Gastos fijos", "Hogar"),
+    ("Cuentas básicas", "Gastos fijos", "Hogar"),
+    ("Suscripciones", "Gastos fijos", "Ocio"),
+    ("Supermercado", "Gastos Variables", "Hogar"),
+    ("Transporte", "Gastos Variables", "Movilidad"),
+    ("Combustible", "Gastos Variables", "Movilidad"),
+    ("Restaurantes", "Gastos Variables", "Ocio"),
+    ("Farmacia", "Gastos Variables", "Salud"),
+    ("Pendiente", "Pendiente", "Sin Agrupar"),
+]
+
+# (detail template, category, sign, typical amount in pesos): Chilean checking-account wording
+MERCHANTS = [
+    ("ABONO REMUNERACIONES ACME SPA", "Sueldo", 1, 1_850_000),
+    ("TRANSF DE {persona}", "Transferencias recibidas", 1, 60_000),
+    ("TRANSF. A {persona} ARRIENDO", "Arriendo", -1, 650_000),
+    ("PAGO EN LINEA ENEL DISTRIBUCION", "Cuentas básicas", -1, 38_000),
+    ("PAGO EN LINEA AGUAS ANDINAS", "Cuentas básicas", -1, 18_000),
+    ("CARGO POR PAC VTR COMUNICACIONES", "Cuentas básicas", -1, 32_000),
+    ("COMPRA INTERNACIONAL NETFLIX.COM", "Suscripciones", -1, 9_000),
+    ("COMPRA INTERNACIONAL SPOTIFY", "Suscripciones", -1, 6_500),
+    ("COMPRA NACIONAL LIDER EXPRESS {comuna}", "Supermercado", -1, 45_000),
+    ("COMPRA NACIONAL JUMBO {comuna}", "Supermercado", -1, 80_000),
+    ("COMPRA NACIONAL UNIMARC {comuna}", "Supermercado", -1, 25_000),
+    ("COMPRA NACIONAL UBER *TRIP", "Transporte", -1, 7_500),
+    ("CARGA TARJETA BIP! METRO", "Transporte", -1, 10_000),
+    ("COMPRA NACIONAL COPEC {comuna}", "Combustible", -1, 40_000),
+    ("COMPRA NACIONAL SHELL {comuna}", "Combustible", -1, 35_000),
+    ("COMPRA NACIONAL CAFÉ {comuna}", "Restaurantes", -1, 12_000),
+    ("COMPRA NACIONAL SUSHI {comuna}", "Restaurantes", -1, 22_000),
+    ("COMPRA NACIONAL FARMACIAS AHUMADA", "Farmacia", -1, 15_000),
+    ("COMPRA NACIONAL CRUZ VERDE {comuna}", "Farmacia", -1, 11_000),
+    ("GIRO CAJERO AUTOMATICO {comuna}", "Pendiente", -1, 40_000),
+    ("PAGO TARJETA DE CREDITO", "Pendiente", -1, 300_000),
+]
+COMUNAS = ["ÑUÑOA", "PROVIDENCIA", "LAS CONDES", "MAIPU", "LA FLORIDA", "SANTIAGO", "VIÑA DEL MAR"]
+PERSONAS = ["JUAN PÉREZ", "MARÍA GONZÁLEZ", "JOSÉ MUÑOZ", "CAMILA ROJAS", "DIEGO SOTO"]
+BANKS = ["CC Santander", "Genérico"]
+
+# Share of movements placed on the days around the accounting cutoff and on month/year ends
+EDGE_SHARE = 0.15
+SIZES = [1_000, 10_000, 100_000, 1_000_000]
+# Rows of the synthetic statements (a statement is small next to the ledger)
+CARTOLA_MAX_ROWS = 50_000
+
+
+def _details(rng, templates, n):
+    """Fills {comuna}/{persona} placeholders, over distinct (template, filler) pairs only."""
+    comunas = rng.integers(0, len(COMUNAS), n)
+    personas = rng.integers(0, len(PERSONAS), n)
+    pairs = pd.DataFrame({'t': templates, 'c': comunas, 'p': personas})
+    codes, uniques = pd.factorize(pd.MultiIndex.from_frame(pairs))
+    filled = [MERCHANTS[t][0].format(comuna=COMUNAS[c], persona=PERSONAS[p]) for t, c, p in uniques]
+    return np.array(filled, dtype=object)[codes]
+
+
+def _dates(rng, n, start, days):
+    """Uniform dates, with EDGE_SHARE of them on cutoff-day and year-end edge cases."""
+    offsets = rng.integers(0, days, n)
+    dates = (np.datetime64(start) + offsets.astype('timedelta64[D]')).astype('datetime64[D]')
+    edge = rng.random(n) < EDGE_SHARE
+    if edge.any():
+        months = dates[edge].astype('datetime64[M]')
+        # Day before, on and after the cutoff, the last day of the month and Dec 31 / Jan 1
+        day_choices = np.array([ACCOUNTING_CUTOFF_DAY - 2, ACCOUNTING_CUTOFF_DAY - 1, ACCOUNTING_CUTOFF_DAY])
+        on_cutoff = months.astype('datetime64[D]') + rng.choice(day_choices, edge.sum()).astype('timedelta64[D]')
+        month_end = (months + 1).astype('datetime64[D]') - np.timedelta64(1, 'D')
+        years = dates[edge].astype('datetime64[Y]')
+        year_turn = np.where(rng.random(edge.sum()) < 0.5,
+                             (years + 1).astype('datetime64[D]') - np.timedelta64(1, 'D'),
+                             years.astype('datetime64[D]'))
+        kind = rng.integers(0, 3, edge.sum())
+        dates[edge] = np.where(kind == 0, on_cutoff, np.where(kind == 1, month_end, year_turn))
+    return pd.to_datetime(dates)
+
+
+def generate_ledger(n_facts, seed=0, start="2023-01-01", days=1095):
+    """
+    Synthetic tables in the server layout (what PostgREST returns).
+
+    Args:
+        n_facts: Number of movements.
+        seed: Random seed; the same seed always yields the same tables.
+        start: First possible movement date.
+        days: Span of the movement dates.
+
+    Returns:
+        dict with 'categories', 'facts' and 'budget' DataFrames. facts has
+        id, date, period, detail, amount, bank, category_id, status,
+        fingerprint and updated_at; about a third of the movements are
+        still 'Pendiente' (half of them without category_id).
+    """
+    rng = np.random.default_rng(seed)
+    categories = pd.DataFrame(
+        [{"id": i + 1, "name": name, "type": tipo, "grouper": grouper}
+         for i, (name, tipo, grouper) in enumerate(CATEGORIES)])
+    cat_id = dict(zip(categories['name'], categories['id']))
+
+    templates = rng.integers(0, len(MERCHANTS), n_facts)
+    signs = np.array([m[2] for m in MERCHANTS])[templates]
+    typical = np.array([m[3] for m in MERCHANTS])[templates]
+    amounts = signs * np.maximum(100, np.round(typical * rng.lognormal(0, 0.35, n_facts), -1)).astype('int64')
+    dates = _dates(rng, n_facts, start, days)
+
+    merchant_category = np.array([cat_id[m[1]] for m in MERCHANTS])[templates]
+    pending = (rng.random(n_facts) < 0.25) | (merchant_category == cat_id["Pendiente"])
+    category_id = pd.array(np.where(pending, cat_id["Pendiente"], merchant_category), dtype='Int64')
+    category_id[pending & (rng.random(n_facts) < 0.5)] = pd.NA
+
+    # One distinct, increasing updated_at per row, as left by a history of single writes
+    updated = pd.Timestamp("2025-01-01", tz="UTC") + pd.to_timedelta(np.arange(n_facts), unit="s")
+    facts = pd.DataFrame({
+        "id": np.arange(1, n_facts + 1),
+        "date": dates.strftime('%Y-%m-%d'),
+        "period": get_accounting_months(dates).to_numpy(),
+        "detail": _details(rng, templates, n_facts),
+        "amount": amounts,
+        "bank": np.array(BANKS, dtype=object)[rng.integers(0, len(BANKS), n_facts)],
+        "category_id": category_id,
+        "status": np.where(pending, "Pendiente", "Conciliado"),
+        "fingerprint": [f"{i:032x}" for i in range(1, n_facts + 1)],
+        "updated_at": updated.strftime('%Y-%m-%dT%H:%M:%S+00:00'),
+    })
+
+    periods = sorted(p for p in facts['period'].unique() if p)
+    budget = pd.DataFrame(
+        [{"category_id": cid, "period": period, "amount": int(rng.integers(1, 50)) * 10_000}
+         for cid in categories['id'] for period in periods])
+    budget.insert(0, "id", np.arange(1, len(budget) + 1))
+    return {"categories": categories, "facts": facts, "budget": budget}
+
+
+def cartola_frame(n_rows, seed=0, start="2025-01-01"):
+    """Statement rows as a bank exports them (Fecha DD/MM/YYYY, Detalle, cargo/abono)."""
+    rng = np.random.default_rng(seed + 1)
+    templates = rng.integers(0, len(MERCHANTS), n_rows)
+    signs = np.array([m[2] for m in MERCHANTS])[templates]
+    typical = np.array([m[3] for m in MERCHANTS])[templates]
+    amounts = np.maximum(100, np.round(typical * rng.lognormal(0, 0.35, n_rows), -1)).astype('int64')
+    dates = _dates(rng, n_rows, start, 90)
+    return pd.DataFrame({
+        "Fecha": dates.strftime('%d/%m/%Y'),
+        "Detalle": _details(rng, templates, n_rows),
+        "Monto cargo ($)": np.where(signs < 0, amounts, 0),
+        "Monto abono ($)": np.where(signs > 0, amounts, 0),
+    })
+
+
+def santander_xlsx(frame):
+    """Santander-style .xlsx bytes: account header, titles on row 3, then the movements."""
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(["Cartola Cuenta Corriente"])
+    sheet.append([f"Cuenta: {SantanderParser.CUENTA_PROPIA}", f"Emitida: {date.today():%d/%m/%Y}"])
+    sheet.append(list(frame.columns))
+    for row in frame.itertuples(index=False):
+        sheet.append(list(row))
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+def generic_csv(frame, sep=";"):
+    """Generic CSV bytes with Fecha, Detalle and Monto (Chilean thousands separator)."""
+    monto = frame["Monto abono ($)"] - frame["Monto cargo ($)"]
+    out = pd.DataFrame({
+        "Fecha": frame["Fecha"],
+        "Detalle": frame["Detalle"],
+        "Monto": monto.map("{:,}".format).str.replace(",", "."),
+    })
+    return out.to_csv(index=False, sep=sep).encode("utf-8")
@@ -50,14 +50,17 @@ headers = {
 }
 
 # 2. Init Dropbox Client
+data_dir = "data"
+# Hashes/revs of the last sync: unchanged files are not downloaded again
+manifest_path = os.path.join(data_dir, ".dropbox_manifest.json")
 if dbx_refresh and dbx_app_key and dbx_app_secret:
-    dbx_manager = DropboxManager(refresh_token=dbx_refresh, app_key=dbx_app_key, app_secret=dbx_app_secret)
+    dbx_manager = DropboxManager(refresh_token=dbx_refresh, app_key=dbx_app_key, app_secret=dbx_app_secret,
+                                 manifest_path=manifest_path)
 else:
-    dbx_manager = DropboxManager(access_token=dbx_token)
+    dbx_manager = DropboxManager(access_token=dbx_token, manifest_path=manifest_path)
 
 # 3. Download Data from Dropbox
 print("--- Downloading data from Dropbox ---")
-data_dir = "data"
 os.makedirs(data_dir, exist_ok=True)
 
 PATH_BANCO = os.path.join(data_dir, "base_cc_santander.csv")
@@ -71,15 +74,12 @@ files_to_download = [
     ("/presupuesto.csv", PATH_PRESUPUESTO)
 ]
 
-for dbx_path, local_path in files_to_download:
-    try:
-        ok, msg = dbx_manager.download_file(dbx_path, local_path)
-        if ok:
-            print(f"Downloaded: {dbx_path}")
-        else:
-            print(f"Warning: Could not download {dbx_path}: {msg}")
-    except Exception as e:
-        print(f"Error downloading {dbx_path}: {e}")
+# One metadata call for all files; only those whose content_hash changed are downloaded
+for dbx_path, (ok, msg) in dbx_manager.sync_down(files_to_download).items():
+    if ok:
+        print(msg)
+    else:
+        print(f"Warning: Could not download {dbx_path}: {msg}")
 
 def calculate_period(dt_str):
     try:
@@ -0,0 +1,30 @@
+-- Schema changes the app relies on after migrate_v2.py.
+-- Run once in the Supabase SQL editor (safe to run again).
+
+BEGIN;
+
+-- Budget: one amount per (category, period)
+-- The budget editor upserts with on_conflict=category_id,period, which needs
+-- a unique key on those columns. migrate_v2.py posted plain inserts, so keep
+-- only the newest row of each pair before adding it.
+DELETE FROM budget older
+USING budget newer
+WHERE older.category_id = newer.category_id
+  AND older.period = newer.period
+  AND older.id < newer.id;
+
+CREATE UNIQUE INDEX IF NOT EXISTS budget_category_id_period_key ON budget (category_id, period);
+
+-- Facts: fingerprint per movement (see utils/fingerprints.py)
+-- Imports upsert with on_conflict=fingerprint, ignoring duplicates. The key
+-- allows NULLs, so rows created without a fingerprint (migrate_v2.py) are
+-- valid; run backfill_fingerprints.py afterwards to fill them in (hashing the
+-- normalized detail needs Python, so it cannot be done here).
+ALTER TABLE facts ADD COLUMN IF NOT EXISTS fingerprint text;
+
+CREATE UNIQUE INDEX IF NOT EXISTS facts_fingerprint_key ON facts (fingerprint);
+
+COMMIT;
+
+-- Reload the PostgREST schema cache so the new key is visible right away
+NOTIFY pgrst, 'reload schema';
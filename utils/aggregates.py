@@ -0,0 +1,135 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+from utils.row_tracker import RowTracker
+
+
+def clean_categories(categories):
+    """Collapses inner whitespace and strips category names (over distinct values only)."""
+    categories = pd.Series(categories).astype(str)
+    codes, uniques = pd.factorize(categories)
+    cleaned = pd.Index(uniques).str.replace(r'\s+', ' ', regex=True).str.strip()
+    return pd.Series(cleaned.take(codes), index=categories.index)
+
+
+class MonthlyCube:
+    """
+    Monthly aggregate cube over facts for the home dashboard.
+
+    Cells are keyed by (Mes_Contable, Categoria, Tipo, Conciliado, Signo)
+    and hold the summed amount and the number of movements, so the month
+    KPIs, the per-category table and the chart read a handful of cells
+    instead of filtering every movement.
+
+    The cube is built once and maintained incrementally: only facts that
+    are new, gone or whose Mes_Contable/Categoria/Monto changed (see
+    utils.row_tracker) are subtracted from / added to their cells. A
+    change in the category -> type mapping rebuilds it.
+
+    A movement is 'Conciliado' when its category is not 'Pendiente'; Signo
+    is 1 for income, -1 for expenses and 0 for zero amounts. Tipo comes from
+    the category mapping ('Otros' when the category has none).
+    """
+
+    KEYS = ['Mes_Contable', 'Categoria', 'Tipo', 'Conciliado', 'Signo']
+    COLUMNS = ['Mes_Contable', 'Categoria', 'Monto']
+
+    def __init__(self):
+        self.cube = self._empty_cube()
+        self._rows = None       # per fact id: key columns and Monto, as last applied
+        self._tipo_map = None
+        self._changes = RowTracker(self.COLUMNS)
+        self._lock = threading.Lock()
+        self.stats = {"builds": 0, "incremental_updates": 0, "rows_applied": 0}
+
+    @classmethod
+    def _empty_cube(cls):
+        index = pd.MultiIndex.from_arrays([[]] * len(cls.KEYS), names=cls.KEYS)
+        return pd.DataFrame({'Monto': pd.Series(dtype='float64'), 'N': pd.Series(dtype='int64')}, index=index)
+
+    def _fact_rows(self, facts, tipo_map):
+        categorias = clean_categories(facts['Categoria']).to_numpy()
+        montos = pd.to_numeric(facts['Monto'], errors='coerce').fillna(0).to_numpy(dtype='float64')
+        rows = pd.DataFrame({
+            'Mes_Contable': facts['Mes_Contable'].to_numpy(),
+            'Categoria': categorias,
+            'Tipo': pd.Series(categorias).map(tipo_map).fillna('Otros').to_numpy(),
+            'Conciliado': categorias != 'Pendiente',
+            'Signo': np.sign(montos).astype('int8'),
+            'Monto': montos,
+        }, index=pd.Index(facts['id'].to_numpy(), name='id'))
+        return rows[rows['Mes_Contable'].notna()]
+
+    @classmethod
+    def _aggregate(cls, rows):
+        grouped = rows.groupby(cls.KEYS, sort=False)['Monto']
+        return pd.DataFrame({'Monto': grouped.sum(), 'N': grouped.size()})
+
+    def sync(self, facts, tipo_map):
+        """Brings the cube in line with facts (needs id, Mes_Contable, Categoria, Monto)."""
+        tipo_map = {str(k).strip(): v for k, v in tipo_map.items()}
+        with self._lock:
+            if tipo_map != self._tipo_map:
+                self._changes.reset()
+                self._rows = None
+                self._tipo_map = tipo_map
+            changes = self._changes.diff(facts)
+            if facts.empty or 'id' not in facts.columns:
+                self.cube, self._rows = self._empty_cube(), None
+                return self.cube
+            if self._rows is not None and not changes:
+                return self.cube
+
+            added = self._fact_rows(facts[changes.added], tipo_map)
+            if self._rows is None:
+                self.cube = self._aggregate(added).sort_index()
+                self._rows = added
+                self.stats["builds"] += 1
+                return self.cube
+
+            gone = self._rows.index.isin(changes.removed)
+            removed = self._rows[gone]
+            delta = self._aggregate(added).sub(self._aggregate(removed), fill_value=0)
+            cube = self.cube.add(delta, fill_value=0)
+            self.cube = cube[cube['N'] != 0].astype({'N': 'int64'}).sort_index()
+            self._rows = pd.concat([self._rows[~gone], added])
+            self.stats["incremental_updates"] += 1
+            self.stats["rows_applied"] += len(added) + len(removed)
+            return self.cube
+
+    def months(self):
+        """Accounting months present, newest first."""
+        return sorted(self.cube.index.unique('Mes_Contable'), reverse=True)
+
+    def counts_by_month(self):
+        """Number of movements per accounting month."""
+        return self.cube.groupby(level='Mes_Contable')['N'].sum().reset_index(name='Registros')
+
+    def pending_count(self):
+        """Number of movements still in category 'Pendiente' (all months)."""
+        return int(self.cube.loc[~self.cube.index.get_level_values('Conciliado'), 'N'].sum())
+
+    def month(self, mes):
+        """Cells of one month as a flat frame (Categoria, Tipo, Conciliado, Signo, Monto, N)."""
+        if mes not in self.cube.index.get_level_values('Mes_Contable'):
+            return self._empty_cube().reset_index().drop(columns='Mes_Contable')
+        return self.cube.xs(mes, level='Mes_Contable').reset_index()
+
+    def month_totals(self, mes):
+        """Income/expense totals of a month, with the reconciled/pending split of income."""
+        cells = self.month(mes)
+        ingresos = cells[cells['Signo'] > 0]
+        return {
+            'ingresos': ingresos['Monto'].sum(),
+            'gastos': cells.loc[cells['Signo'] < 0, 'Monto'].sum(),
+            'ingresos_conciliado': ingresos.loc[ingresos['Conciliado'], 'Monto'].sum(),
+            'ingresos_pendiente': ingresos.loc[~ingresos['Conciliado'], 'Monto'].sum(),
+        }
+
+    def by_category(self, mes):
+        """Absolute amount moved per category in a month (Categoria, Monto_Abs)."""
+        cells = self.month(mes)
+        cells = cells.assign(Monto_Abs=cells['Monto'].abs())
+        return cells.groupby('Categoria', as_index=False)['Monto_Abs'].sum()
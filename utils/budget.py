@@ -0,0 +1,108 @@
+import numpy as np
+import pandas as pd
+
+from utils.aggregates import clean_categories
+
+
+class BudgetEngine:
+    """
+    Monthly and cumulative budget balances from the pivoted budget.
+
+    The budget is held as a category x month matrix and the category types
+    as a sign vector (+1 for 'Ingresos', -1 for everything else), so the net
+    balance of every month is one matrix product and the running balance a
+    cumsum over it.
+
+    What-if values typed in the editor are applied as overrides: only the
+    edited columns are re-evaluated, as a correction on top of the stored
+    budget, so the budget frame itself is never copied or modified.
+
+    Args:
+        df_budget: Pivoted budget (Categoria + one 'YYYY-MM' column per month).
+        tipo_map: Category name -> type.
+    """
+
+    def __init__(self, df_budget, tipo_map):
+        self.months = sorted(c for c in df_budget.columns if c != 'Categoria')
+        self.categories = pd.Index(df_budget['Categoria'])
+        self.matrix = np.nan_to_num(df_budget[self.months].to_numpy(dtype='float64'))
+        self.signs = np.where(self.categories.map(tipo_map) == 'Ingresos', 1.0, -1.0)
+        self.net = self.signs @ self.matrix
+
+    def _override_delta(self, edited):
+        """Net change per month implied by the editor values (edited: Categoria + month columns)."""
+        delta = np.zeros(len(self.months))
+        columns = [c for c in edited.columns if c in self.months]
+        rows = self.categories.get_indexer(edited['Categoria'])
+        known = rows >= 0
+        if not columns or not known.any():
+            return delta
+
+        col_idx = [self.months.index(c) for c in columns]
+        rows = rows[known]
+        new = edited.loc[known, columns].apply(pd.to_numeric, errors='coerce').to_numpy(dtype='float64')
+        old = self.matrix[np.ix_(rows, col_idx)]
+        # Empty cells keep the stored value (same as DataFrame.update)
+        change = np.where(np.isnan(new), 0.0, new - old)
+        delta[col_idx] = self.signs[rows] @ change
+        return delta
+
+    def net_for(self, month):
+        """Budgeted income minus expenses of one month (0 if the month has no budget)."""
+        return float(self.net[self.months.index(month)]) if month in self.months else 0.0
+
+    def balances(self, overrides=None):
+        """
+        Returns a DataFrame indexed by month with 'Saldo_Mes' (income minus
+        expenses) and 'Saldo_Acumulado' (running total since the first month).
+        """
+        net = self.net if overrides is None else self.net + self._override_delta(overrides)
+        return pd.DataFrame(
+            {'Saldo_Mes': net, 'Saldo_Acumulado': np.cumsum(net)},
+            index=pd.Index(self.months, name='period'),
+        )
+
+
+# Display order of category types in the comparison (other types go last)
+TYPE_ORDER = ["Ingresos", "Pendiente", "Gastos fijos", "Gastos Variables"]
+
+
+def budget_vs_actual(actual, df_budget, month, tipo_map):
+    """
+    Per-category comparison of actual amounts against the month's budget.
+
+    Args:
+        actual: Categoria + Monto_Abs (absolute amount moved per category).
+        df_budget: Pivoted budget (Categoria + 'YYYY-MM' columns).
+        month: Budget column to compare against.
+        tipo_map: Category name -> type ('Otros' when missing).
+
+    Returns:
+        pd.DataFrame with Categoria, Monto_Abs, Presupuesto, Diferencia,
+        Tipo_Cat and Orden, restricted to categories with movements or a
+        positive budget and sorted by type order, then amount. Diferencia is
+        actual minus budget for income and budget minus actual otherwise,
+        so a negative value is always unfavourable.
+    """
+    if month in df_budget.columns:
+        budget = pd.DataFrame({
+            'Categoria': clean_categories(df_budget['Categoria']).to_numpy(),
+            'Presupuesto': df_budget[month].to_numpy(),
+        })
+        comparison = actual.merge(budget, on='Categoria', how='outer').fillna(0)
+    else:
+        comparison = actual.assign(Presupuesto=0)
+    comparison = comparison[(comparison['Monto_Abs'] > 0) | (comparison['Presupuesto'] > 0)]
+
+    tipo_map = {str(k).strip(): v for k, v in tipo_map.items()}
+    tipos = comparison['Categoria'].map(tipo_map).fillna('Otros')
+    real = comparison['Monto_Abs'].to_numpy()
+    meta = comparison['Presupuesto'].to_numpy()
+    codes = pd.Categorical(tipos, categories=TYPE_ORDER, ordered=True).codes
+
+    comparison = comparison.assign(
+        Diferencia=np.where(tipos.to_numpy() == 'Ingresos', real - meta, meta - real),
+        Tipo_Cat=tipos.to_numpy(),
+        Orden=np.where(codes >= 0, codes + 1, 99),
+    )
+    return comparison.sort_values(['Orden', 'Monto_Abs'], ascending=[True, False])
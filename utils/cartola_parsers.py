@@ -0,0 +1,205 @@
+import csv
+import io
+import itertools
+
+import pandas as pd
+from openpyxl import load_workbook
+
+# Rows peeked at the top of a sheet / bytes sniffed at the start of a CSV to pick a parser
+HEADER_ROWS = 5
+SNIFF_BYTES = 64 * 1024
+
+COLUMNAS_CARTOLA = ['Fecha', 'Detalle', 'Monto', 'Banco', 'Categoria']
+
+
+def normalizar_dataframe_import(df):
+    """Estandariza fechas y montos en el momento de la importación (Cartola)"""
+    if df.empty: return df
+
+    # 1. Normalizar FECHAS a string DD-MM-YYYY
+    # Forzamos dayfirst=True para formato local cartolas
+    df['Fecha_tmp'] = pd.to_datetime(df['Fecha'], dayfirst=True, errors='coerce')
+    # Los que no pudieron, intentamos sin dayfirst (ISO)
+    fallidos = df['Fecha_tmp'].isna()
+    if fallidos.any():
+        df.loc[fallidos, 'Fecha_tmp'] = pd.to_datetime(df.loc[fallidos, 'Fecha'], errors='coerce')
+
+    # Convertimos a string estándar DD-MM-YYYY para la base de datos (PATH_BANCO)
+    df['Fecha'] = df['Fecha_tmp'].dt.strftime('%d-%m-%Y')
+
+    # 2. Normalizar MONTOS
+    if df['Monto'].dtype == object:
+        df['Monto'] = df['Monto'].astype(str).str.replace('$', '', regex=False).str.replace('.', '', regex=False).str.replace(',', '.', regex=False).str.replace('\xa0', '', regex=False).str.strip()
+    df['Monto'] = pd.to_numeric(df['Monto'], errors='coerce').fillna(0)
+
+    return df.drop(columns=['Fecha_tmp'], errors='ignore')
+
+
+class CartolaSource:
+    """
+    An uploaded statement opened once for detection and parsing.
+
+    Attributes:
+        kind: 'xlsx' or 'csv'.
+        header_rows: First HEADER_ROWS rows as tuples of cell values.
+        rows: (xlsx) Iterator over the remaining rows, continuing the same
+            read-only pass used to peek the header.
+        file: (csv) Binary file positioned at the start.
+        dialect: (csv) Sniffed csv dialect.
+    """
+
+    def __init__(self, kind, header_rows, rows=None, file=None, dialect=None):
+        self.kind = kind
+        self.header_rows = header_rows
+        self.rows = rows
+        self.file = file
+        self.dialect = dialect
+
+    @property
+    def header_text(self):
+        return " ".join(str(v) for row in self.header_rows for v in row if v is not None)
+
+
+class CartolaParser:
+    """
+    Base class for a bank statement format.
+
+    Subclasses set kind and label, implement matches() with a cheap check
+    on the header rows only, and parse() returning the normalized frame
+    (COLUMNAS_CARTOLA). Register them with @register_parser.
+    """
+
+    kind = None
+    label = ""
+
+    def matches(self, source):
+        raise NotImplementedError
+
+    def parse(self, source):
+        raise NotImplementedError
+
+
+PARSERS = []
+
+
+def register_parser(cls):
+    """Class decorator adding a parser to the registry (tried in registration order)."""
+    PARSERS.append(cls())
+    return cls
+
+
+def _column(columns, fragment):
+    return next(i for i, c in enumerate(columns) if fragment in c)
+
+
+@register_parser
+class SantanderParser(CartolaParser):
+    """Santander checking account (.xlsx): account number in the top rows, titles on row 3."""
+
+    kind = 'xlsx'
+    CUENTA_PROPIA = "0-000-74-80946-4"
+    label = f"Santander detectado: Cuenta {CUENTA_PROPIA}"
+    TITLE_ROW = 2
+
+    def matches(self, source):
+        return self.CUENTA_PROPIA in source.header_text
+
+    def parse(self, source):
+        columns = [str(c).strip() if c is not None else '' for c in source.header_rows[self.TITLE_ROW]]
+        # Columnas por nombre parcial para evitar el KeyError
+        i_fecha, i_detalle = _column(columns, 'Fecha'), _column(columns, 'Detalle')
+        i_cargo, i_abono = _column(columns, 'Monto cargo'), _column(columns, 'Monto abono')
+
+        # Only the four needed cells of each non-empty row are kept from the read-only pass
+        rows = itertools.chain(source.header_rows[self.TITLE_ROW + 1:], source.rows)
+        df = pd.DataFrame(
+            [(r[i_fecha], r[i_detalle], r[i_cargo], r[i_abono]) for r in rows if any(v is not None for v in r)],
+            columns=['Fecha', 'Detalle', 'cargo', 'abono'],
+        )
+        if df.empty:
+            return pd.DataFrame(columns=COLUMNAS_CARTOLA)
+        abonos = pd.to_numeric(df['abono'], errors='coerce').fillna(0)
+        cargos = pd.to_numeric(df['cargo'], errors='coerce').fillna(0)
+        df.insert(2, 'Monto', abonos - cargos)
+        df['Banco'] = 'CC Santander'
+        df['Categoria'] = 'Pendiente'
+        # Normalización INMEDIATA al detectar
+        return normalizar_dataframe_import(df.drop(columns=['cargo', 'abono']))
+
+
+@register_parser
+class GenericCsvParser(CartolaParser):
+    """Generic CSV with Fecha, Detalle and Monto columns (any delimiter)."""
+
+    kind = 'csv'
+    label = "Archivo CSV estándar detectado"
+    REQUIRED = ('Fecha', 'Detalle', 'Monto')
+
+    def matches(self, source):
+        header = {str(c).strip() for c in source.header_rows[0]} if source.header_rows else set()
+        return set(self.REQUIRED).issubset(header)
+
+    def parse(self, source):
+        # Only the required columns are parsed
+        df = pd.read_csv(
+            source.file, sep=source.dialect.delimiter, quotechar=source.dialect.quotechar,
+            engine='c', usecols=lambda c: c.strip() in self.REQUIRED,
+        )
+        df.columns = df.columns.str.strip()
+        if df.empty:
+            return pd.DataFrame(columns=COLUMNAS_CARTOLA)
+        df = df[list(self.REQUIRED)].assign(Banco='Genérico', Categoria='Pendiente')
+        return normalizar_dataframe_import(df)
+
+
+def _open_xlsx(file):
+    workbook = load_workbook(file, read_only=True, data_only=True)
+    # First sheet, as pd.read_excel did (the active one is whichever was selected when saving)
+    rows = workbook.worksheets[0].iter_rows(values_only=True)
+    header_rows = list(itertools.islice(rows, HEADER_ROWS))
+    return CartolaSource('xlsx', header_rows, rows=rows), workbook
+
+
+def _open_csv(file):
+    sample = file.read(SNIFF_BYTES).decode('utf-8-sig', errors='replace')
+    file.seek(0)
+    # Cut the sample at the last full line so the sniffer does not see a partial record
+    if len(sample) >= SNIFF_BYTES and '\n' in sample:
+        sample = sample[:sample.rindex('\n')]
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=",;\t|")
+    except csv.Error:
+        dialect = csv.excel
+    header_rows = list(itertools.islice(csv.reader(io.StringIO(sample), dialect), HEADER_ROWS))
+    return CartolaSource('csv', header_rows, file=file, dialect=dialect)
+
+
+def read_cartola(file, filename):
+    """
+    Detects the statement format and parses it in a single pass.
+
+    Args:
+        file: Binary file-like object (e.g. a Streamlit UploadedFile).
+        filename: Original name; the extension selects xlsx or csv parsers.
+
+    Returns:
+        (df, parser): normalized frame and the parser used, or (None, None)
+        if no registered parser recognizes the file.
+    """
+    name = filename.lower()
+    workbook = None
+    if name.endswith('.xlsx'):
+        source, workbook = _open_xlsx(file)
+    elif name.endswith('.csv'):
+        source = _open_csv(file)
+    else:
+        return None, None
+
+    try:
+        for parser in PARSERS:
+            if parser.kind == source.kind and parser.matches(source):
+                return parser.parse(source), parser
+        return None, None
+    finally:
+        if workbook is not None:
+            workbook.close()
@@ -0,0 +1,175 @@
+import math
+import re
+
+import numpy as np
+import pandas as pd
+
+from utils.fingerprints import normalize_details
+from utils.row_tracker import RowTracker
+
+_NOISE_RE = re.compile(r"[^a-z ]+")
+
+
+def merchant_keys(details):
+    """
+    Normalized merchant key of each detail: case/accent folded, digits and
+    punctuation removed ('COMPRA LIDER 27' -> 'compra lider').
+    """
+    normalized = normalize_details(details)
+    codes, uniques = pd.factorize(normalized)
+    keys = [" ".join(_NOISE_RE.sub(" ", d).split()) for d in uniques]
+    return pd.Series(pd.Index(keys, dtype=object).take(codes), index=normalized.index)
+
+
+class Categorizer:
+    """
+    Suggests categories for pending movements from the reconciled ones.
+
+    fit() learns three kinds of evidence from facts whose category is not
+    'Pendiente':
+
+    - Merchant rules: normalized merchant key -> category distribution
+      ('compra lider' was 'Supermercado' 9 out of 10 times).
+    - Keyword rules: tokens that point to one category with enough support
+      and purity, compiled into a single alternation regex so a detail is
+      scanned once for all keywords (multi-pattern matching).
+    - Amount hints: the usual sign of each category; a suggestion whose
+      sign disagrees with the movement (an expense into an income
+      category) loses confidence.
+
+    predict() works on distinct merchant keys only, so a batch costs one
+    pass per distinct merchant rather than per movement.
+
+    Args:
+        min_support: Movements needed before a keyword becomes a rule.
+        min_purity: Share of the top category needed for a keyword rule.
+    """
+
+    PENDIENTE = 'Pendiente'
+    COLUMNS = ['Detalle', 'Monto', 'Categoria']
+
+    def __init__(self, min_support=2, min_purity=0.8):
+        self.min_support = min_support
+        self.min_purity = min_purity
+        self.merchant_rules = {}    # key -> (category, confidence)
+        self.keyword_rules = {}     # token -> (category, weight, confidence)
+        self.category_sign = {}     # category -> share of positive amounts
+        self._pattern = None
+        self._changes = RowTracker(self.COLUMNS)
+
+    def __len__(self):
+        return len(self.merchant_rules)
+
+    @staticmethod
+    def _confidence(share, support):
+        # Share of the winning category, discounted when it rests on few movements
+        return share * support / (support + 1)
+
+    def fit(self, facts):
+        """Learns rules from facts with Detalle, Monto and Categoria."""
+        # A later sync() refits from scratch: the tracked rows no longer describe these rules
+        self._changes.reset()
+        return self._learn(facts)
+
+    def _learn(self, facts):
+        known = facts[facts['Categoria'].notna() & (facts['Categoria'] != self.PENDIENTE)]
+        self.merchant_rules, self.keyword_rules, self.category_sign = {}, {}, {}
+        self._pattern = None
+        if known.empty:
+            return self
+
+        keys = merchant_keys(known['Detalle']).to_numpy()
+        categorias = known['Categoria'].to_numpy()
+        pairs = pd.DataFrame({'key': keys, 'Categoria': categorias})
+
+        counts = pairs.groupby(['key', 'Categoria'], sort=False).size().rename('n').reset_index()
+        totals = counts.groupby('key')['n'].transform('sum')
+        best = counts.assign(total=totals).sort_values('n', ascending=False).drop_duplicates('key')
+        best = best[best['key'] != '']
+        self.merchant_rules = {
+            k: (c, self._confidence(n / t, t))
+            for k, c, n, t in zip(best['key'], best['Categoria'], best['n'], best['total'])
+        }
+
+        tokens = pairs.assign(token=pairs['key'].str.split()).explode('token')
+        tokens = tokens[tokens['token'].str.len() >= 3]
+        token_counts = tokens.groupby(['token', 'Categoria'], sort=False).size().rename('n').reset_index()
+        token_totals = token_counts.groupby('token')['n'].transform('sum')
+        top = token_counts.assign(total=token_totals).sort_values('n', ascending=False).drop_duplicates('token')
+        top = top[(top['total'] >= self.min_support) & (top['n'] / top['total'] >= self.min_purity)]
+        # Same support discount as merchant rules: a token seen twice is weak evidence
+        self.keyword_rules = {
+            t: (c, math.log1p(n), self._confidence(n / total, total))
+            for t, c, n, total in zip(top['token'], top['Categoria'], top['n'], top['total'])
+        }
+        if self.keyword_rules:
+            # Longest first so a keyword is not shadowed by a shorter one it contains
+            alternation = "|".join(re.escape(t) for t in sorted(self.keyword_rules, key=len, reverse=True))
+            self._pattern = re.compile(rf"\b(?:{alternation})\b")
+
+        positive = pd.to_numeric(known['Monto'], errors='coerce').fillna(0).to_numpy() > 0
+        self.category_sign = pd.Series(positive).groupby(categorias).mean().to_dict()
+        return self
+
+    def sync(self, facts):
+        """
+        Refits only when Detalle/Monto/Categoria of facts changed since the
+        last sync (facts needs id). The resident frame passed again on a
+        rerun is recognized by identity and costs nothing.
+        """
+        if self._changes.diff(facts):
+            self._learn(facts)
+        return self
+
+    def _by_keywords(self, key):
+        votes = {}
+        for token in self._pattern.findall(key):
+            category, weight, confidence = self.keyword_rules[token]
+            score, best = votes.get(category, (0.0, 0.0))
+            votes[category] = (score + weight, max(best, confidence))
+        if not votes:
+            return None, 0.0
+        ranked = sorted(votes.items(), key=lambda kv: kv[1][0], reverse=True)
+        category, (score, best) = ranked[0]
+        runner_up = ranked[1][1][0] if len(ranked) > 1 else 0.0
+        # Keyword evidence is weaker than a known merchant: strictly below a merchant rule
+        # resting on the same movements, and split on ties
+        return category, 0.9 * best * score / (score + runner_up)
+
+    def predict(self, details, amounts=None):
+        """
+        Suggests a category per movement.
+
+        Returns:
+            pd.DataFrame aligned with details (positional index) with
+            'Categoria' (None when there is no evidence), 'Confianza' in
+            [0, 1] and 'Regla' ('comercio', 'palabra' or None).
+        """
+        keys = merchant_keys(details).reset_index(drop=True)
+        codes, uniques = pd.factorize(keys)
+        n_unique = len(uniques)
+        categoria = np.full(n_unique, None, dtype=object)
+        confianza = np.zeros(n_unique)
+        regla = np.full(n_unique, None, dtype=object)
+
+        for i, key in enumerate(uniques):
+            rule = self.merchant_rules.get(key)
+            if rule is not None:
+                categoria[i], confianza[i], regla[i] = rule[0], rule[1], 'comercio'
+            elif self._pattern is not None:
+                category, confidence = self._by_keywords(key)
+                if category is not None:
+                    categoria[i], confianza[i], regla[i] = category, confidence, 'palabra'
+
+        result = pd.DataFrame({
+            'Categoria': categoria.take(codes),
+            'Confianza': confianza.take(codes),
+            'Regla': regla.take(codes),
+        })
+        if amounts is not None and self.category_sign:
+            positive = pd.to_numeric(pd.Series(amounts), errors='coerce').fillna(0).to_numpy() > 0
+            share_positive = result['Categoria'].map(self.category_sign).to_numpy(dtype='float64')
+            agreement = np.where(positive, share_positive, 1 - share_positive)
+            # Amount hint: halve confidence when the sign is unusual for the category
+            result['Confianza'] *= np.where(np.nan_to_num(agreement, nan=1.0) < 0.2, 0.5, 1.0)
+        return result
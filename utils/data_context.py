@@ -0,0 +1,291 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import cached_property
+
+import pandas as pd
+import pyarrow as pa
+
+from utils.date_utils import get_accounting_months
+from utils.facts_sync import FACTS_SELECT
+from utils.perf import propagate, traced
+
+FACTS_COLUMNS = ['id', 'Fecha', 'Detalle', 'Monto', 'Banco', 'Categoria', 'status', 'period', 'Fecha_dt']
+# Columnas de baja cardinalidad que se guardan como category (códigos + diccionario)
+FACTS_CATEGORICAS = ['Categoria', 'Banco', 'status', 'period', 'Mes_Contable']
+# Columnas que solo sirven para cargar o sincronizar y no se mantienen en memoria
+FACTS_DESCARTABLES = ['categories', 'category_id', 'Fecha', 'created_at', 'updated_at', 'deleted_at']
+# Huella de 16 bytes de ancho fijo (el hex de 32 caracteres ocupa ~5 veces más como str)
+HUELLA_DTYPE = pd.ArrowDtype(pa.binary(16))
+CATEGORIAS_DEFAULT = ["Alimentación", "Transporte", "Vivienda", "Ocio", "Suscripciones", "Pendiente"]
+
+
+@traced("cargar_datos")
+def cargar_datos(sdb, sync=None):
+    """
+    Carga movimientos desde Supabase PostgreSQL (facts join categories),
+    en el layout compacto de preparar_facts.
+
+    Con sync (FactsSync) se usa la copia residente y solo se piden los cambios
+    desde la última marca de agua en vez de toda la tabla. Si el sync se creó
+    con transform=preparar_facts, su copia ya está en este layout y se
+    devuelve tal cual (el mismo objeto mientras no haya cambios).
+    """
+    if sync is not None:
+        df = sync.refresh()
+        return df if sync.transform is preparar_facts else preparar_facts(df)
+    # Usamos select con join a categories para traer el nombre
+    # Lectura paginada: PostgREST corta cada respuesta en 1000 filas
+    return preparar_facts(sdb.query_all("facts", select=FACTS_SELECT))
+
+
+@traced("normalizar_facts")
+def normalizar_facts(df):
+    """Layout de la app para filas de facts (nombres de columnas, Categoria desde el join, tipos)"""
+    if df.empty:
+        return pd.DataFrame(columns=FACTS_COLUMNS)
+
+    # Normalización del layout para la app
+    df = df.rename(columns={
+        'date': 'Fecha',
+        'detail': 'Detalle',
+        'amount': 'Monto',
+        'bank': 'Banco'
+    })
+
+    # Extraer el nombre de la categoría del objeto retornado por Supabase (join)
+    if 'categories' in df.columns:
+        df['Categoria'] = df['categories'].str.get('name').fillna('Pendiente')
+    else:
+        df['Categoria'] = 'Pendiente'
+
+    # Asegurar tipos
+    df['Fecha_dt'] = pd.to_datetime(df['Fecha'], errors='coerce')
+    df['Monto'] = pd.to_numeric(df['Monto'], errors='coerce').fillna(0)
+
+    return df
+
+
+def _huella_binaria(huella):
+    """Huella hex de 32 caracteres -> 16 bytes (None si falta o no es válida: se recalcula al indexar)"""
+    try:
+        binaria = bytes.fromhex(huella)
+    except (TypeError, ValueError):
+        return None
+    return binaria if len(binaria) == 16 else None
+
+
+@traced("compactar_facts")
+def compactar_facts(df):
+    """
+    Representación compacta de facts para mantener en memoria.
+
+    Las columnas repetitivas (Categoria, Banco, status, period, Mes_Contable)
+    pasan a category, Monto a pesos enteros (int64), la fecha queda solo
+    como Fecha_dt (datetime64) y fingerprint como 16 bytes (HUELLA_DTYPE);
+    se descartan el objeto del join, category_id (ya está en Categoria) y
+    las columnas de sincronización. Detalle se mantiene como texto.
+    """
+    if df.empty:
+        return df
+    df = df.drop(columns=[c for c in FACTS_DESCARTABLES if c in df.columns])
+    if 'fingerprint' in df.columns and df['fingerprint'].dtype != HUELLA_DTYPE:
+        df['fingerprint'] = pd.Series(pa.array([_huella_binaria(h) for h in df['fingerprint']], type=pa.binary(16)),
+                                      index=df.index, dtype=HUELLA_DTYPE)
+    tipos = {c: 'category' for c in FACTS_CATEGORICAS if c in df.columns}
+    tipos['Monto'] = 'int64'
+    df['Monto'] = df['Monto'].round()
+    return df.astype(tipos)
+
+
+@traced("preparar_facts")
+def preparar_facts(df):
+    """Filas crudas de facts -> layout compacto de la app, con Mes_Contable calculado"""
+    df = normalizar_facts(df)
+    if not df.empty:
+        df['Mes_Contable'] = get_accounting_months(df['Fecha_dt'])
+    return compactar_facts(df)
+
+
+def lista_categorias(df_cat_map):
+    """Lista ordenada de nombres de categoría (o la lista por defecto si no hay ninguna)"""
+    if not df_cat_map.empty:
+        return sorted(df_cat_map['Categoria'].unique().tolist())
+    return list(CATEGORIAS_DEFAULT)
+
+
+@traced("cargar_categorias")
+def cargar_categorias(sdb, full=False, raise_errors=False):
+    """Obtiene lista de categorías desde Supabase. Si full=True devuelve DataFrame."""
+    df = sdb.query("categories", raise_errors=raise_errors)
+    if df.empty:
+        df = pd.DataFrame(columns=['name', 'type', 'grouper'])
+
+    df = df.rename(columns={'name': 'Categoria', 'type': 'Tipo', 'grouper': 'Agrupador'})
+    if full:
+        return df
+    return lista_categorias(df)
+
+
+@traced("cargar_presupuesto_filas")
+def cargar_presupuesto_filas(sdb, raise_errors=False):
+    """Filas de budget con el nombre de la categoría (sin pivotar)"""
+    return sdb.query_all("budget", select="*,categories(name)", raise_errors=raise_errors)
+
+
+@traced("cargar_presupuesto")
+def cargar_presupuesto(sdb, lista_categorias):
+    """Carga presupuesto desde Supabase y lo pivota para la vista actual"""
+    return pivotar_presupuesto(cargar_presupuesto_filas(sdb), lista_categorias)
+
+
+@traced("pivotar_presupuesto")
+def pivotar_presupuesto(df, lista_categorias):
+    """Pivota las filas de budget (Categoria x periodo) y agrega las categorías sin presupuesto"""
+    # Si está vacío, creamos un DF base con las categorías actuales
+    if df.empty:
+        df_pivot = pd.DataFrame({'Categoria': lista_categorias})
+    else:
+        # Extraer nombre
+        df['Categoria'] = df['categories'].apply(lambda x: x.get('name') if isinstance(x, dict) else 'Unknown')
+        # Pivotar: Index=Categoria, Columns=period, Values=amount
+        df_pivot = df.pivot(index='Categoria', columns='period', values='amount').reset_index().fillna(0)
+
+    # Asegurar que todas las categorías existan en el presupuesto (Sincronización)
+    cat_existentes = set(df_pivot['Categoria'].tolist()) if not df_pivot.empty else set()
+    for cat in lista_categorias:
+        if cat not in cat_existentes:
+            nueva_fila = {col: 0 for col in df_pivot.columns}
+            nueva_fila['Categoria'] = cat
+            df_pivot = pd.concat([df_pivot, pd.DataFrame([nueva_fila])], ignore_index=True)
+
+    return df_pivot
+
+
+class DataContext:
+    """
+    Per-rerun container for the tables every view reads.
+
+    Each table is loaded at most once per script run, on first access, and
+    the same frame is handed to every tab. Views must treat these frames
+    as read-only: filter with masks or copy before adding columns.
+
+    facts is held in the compact layout of compactar_facts (categorical
+    dimensions, integer amounts, Fecha_dt only). With a FactsSync built with
+    transform=preparar_facts, facts is the sync's resident frame itself, so
+    no per-rerun copy is made.
+
+    Args:
+        sdb: SupabaseDB client used for the loads.
+        facts_sync: Optional FactsSync kept across reruns for incremental loads.
+        snapshot: Optional dict of tables (facts, categories, budget) from a
+            local snapshot, served instead of the network.
+    """
+
+    def __init__(self, sdb, facts_sync=None, snapshot=None):
+        self.sdb = sdb
+        self.facts_sync = facts_sync
+        self.snapshot = snapshot
+        self.timings = {}   # source -> seconds spent loading it
+        self.errors = {}    # source -> error message, for sources that failed in load()
+
+    def _load_facts(self):
+        return cargar_datos(self.sdb, self.facts_sync)
+
+    def load(self, max_workers=3):
+        """
+        Fetches facts, categories and budget rows concurrently.
+
+        The three reads are independent, so cold start costs roughly the
+        slowest one instead of their sum; the budget is pivoted once both
+        it and the categories are in. Each source is timed (self.timings).
+        A source that fails is recorded in self.errors and replaced by an
+        empty table, so the other views still work.
+
+        Returns:
+            self
+        """
+        if self.snapshot is not None:
+            return self
+        empty = {
+            "facts": lambda: pd.DataFrame(columns=FACTS_COLUMNS),
+            "categories": lambda: pd.DataFrame(columns=['id', 'Categoria', 'Tipo', 'Agrupador']),
+            "budget": pd.DataFrame,
+        }
+        sources = {
+            "facts": self._load_facts,
+            "categories": lambda: cargar_categorias(self.sdb, full=True, raise_errors=True),
+            "budget": lambda: cargar_presupuesto_filas(self.sdb, raise_errors=True),
+        }
+
+        def timed(name):
+            start = time.perf_counter()
+            try:
+                return sources[name]()
+            finally:
+                self.timings[name] = time.perf_counter() - start
+
+        results = {}
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            futures = {name: pool.submit(propagate(timed), name) for name in sources}
+            for name, future in futures.items():
+                try:
+                    results[name] = future.result()
+                except Exception as e:
+                    self.errors[name] = str(e)
+                    results[name] = empty[name]()
+
+        # Pre-fill the lazy properties with the loaded tables
+        self.__dict__['facts'] = results["facts"]
+        self.__dict__['cat_map'] = results["categories"]
+        self.__dict__['presupuesto'] = pivotar_presupuesto(results["budget"], self.categorias)
+        return self
+
+    def tables(self):
+        """Loaded tables in the layout persisted by SnapshotStore."""
+        return {"facts": self.facts, "categories": self.cat_map, "budget": self.presupuesto}
+
+    def stamp(self):
+        """Cheap fingerprint of the loaded data, to skip rewriting an unchanged snapshot."""
+        if self.facts_sync is not None and self.facts_sync.frame is not None:
+            sync = self.facts_sync
+            facts_stamp = (str(sync.watermark), str(sync.max_id), len(sync.frame))
+        else:
+            facts_stamp = (len(self.facts), str(self.facts['id'].max()) if 'id' in self.facts else '')
+        small = [int(pd.util.hash_pandas_object(df.astype(str), index=False).sum())
+                 for df in (self.cat_map, self.presupuesto)]
+        return (*facts_stamp, *small)
+
+    @cached_property
+    def facts(self):
+        """Movimientos compactos con Fecha_dt y Mes_Contable ya calculados."""
+        if self.snapshot is not None:
+            return self.snapshot["facts"]
+        return self._load_facts()
+
+    @cached_property
+    def cat_map(self):
+        """Dimensión de categorías (id, Categoria, Tipo, Agrupador)."""
+        if self.snapshot is not None:
+            return self.snapshot["categories"]
+        return cargar_categorias(self.sdb, full=True)
+
+    @cached_property
+    def categorias(self):
+        return lista_categorias(self.cat_map)
+
+    @cached_property
+    def tipo_map(self):
+        return dict(zip(self.cat_map['Categoria'], self.cat_map['Tipo']))
+
+    @cached_property
+    def cat_to_id(self):
+        if 'id' not in self.cat_map.columns:
+            return {}
+        return dict(zip(self.cat_map['Categoria'], self.cat_map['id']))
+
+    @cached_property
+    def presupuesto(self):
+        """Presupuesto pivotado (Categoria x periodo)."""
+        if self.snapshot is not None:
+            return self.snapshot["budget"]
+        return cargar_presupuesto(self.sdb, self.categorias)
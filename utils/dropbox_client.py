@@ -1,10 +1,95 @@
 import dropbox
 import dropbox.files
 import dropbox.exceptions
+import hashlib
+import json
 import os
+import posixpath
+import tempfile
+
+# Bytes held in memory at once while streaming a download
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+# Files larger than this are uploaded through an upload session, one chunk per call
+# (a multiple of 4 MB, the block size Dropbox hashes content with)
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+# Block size of Dropbox's content_hash
+HASH_BLOCK_SIZE = 4 * 1024 * 1024
+
+
+def content_hash(local_path):
+    """
+    Dropbox content_hash of a local file: SHA-256 of the concatenated
+    SHA-256 digests of its 4 MB blocks. Equal to FileMetadata.content_hash
+    when the file matches the one in Dropbox. Reads one block at a time.
+    """
+    digests = hashlib.sha256()
+    with open(local_path, "rb") as f:
+        while True:
+            block = f.read(HASH_BLOCK_SIZE)
+            if not block:
+                break
+            digests.update(hashlib.sha256(block).digest())
+    return digests.hexdigest()
+
+
+class SyncManifest:
+    """
+    Small JSON file recording, per Dropbox path, the local copy last synced
+    with it: local path, content_hash, rev, size and mtime.
+
+    It lets a sync tell a local file is unchanged from its size and mtime
+    instead of hashing it again. A missing or unreadable manifest is simply
+    empty: every file is then hashed once and the entries rebuilt.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        try:
+            with open(path, "r") as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def local_hash(self, dropbox_path, local_path):
+        """content_hash of local_path, reused from the manifest while size and mtime match."""
+        stat = os.stat(local_path)
+        entry = self.entries.get(dropbox_path.lower())
+        if (entry and entry.get("local_path") == os.path.abspath(local_path)
+                and entry.get("size") == stat.st_size and entry.get("mtime_ns") == stat.st_mtime_ns):
+            return entry["content_hash"]
+        return content_hash(local_path)
+
+    def record(self, dropbox_path, local_path, metadata):
+        """Stores the state of a file that now matches metadata in Dropbox."""
+        stat = os.stat(local_path)
+        entry = {
+            "local_path": os.path.abspath(local_path),
+            "content_hash": metadata.content_hash,
+            "rev": metadata.rev,
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+        }
+        if self.entries.get(dropbox_path.lower()) != entry:
+            self.entries[dropbox_path.lower()] = entry
+            self.save()
+
+    def save(self):
+        directory = os.path.dirname(self.path) or "."
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".manifest-", suffix=".part")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(self.entries, f, indent=2)
+            os.replace(tmp_path, self.path)
+        except Exception:
+            os.remove(tmp_path)
+            raise
+
 
 class DropboxManager:
-    def __init__(self, access_token=None, refresh_token=None, app_key=None, app_secret=None):
+    def __init__(self, access_token=None, refresh_token=None, app_key=None, app_secret=None,
+                 manifest_path=None):
         if refresh_token and app_key and app_secret:
             # Using refresh token flow for persistent access
             self.dbx = dropbox.Dropbox(
@@ -15,6 +100,8 @@ class DropboxManager:
         else:
             # Fallback to simple access token
             self.dbx = dropbox.Dropbox(access_token)
+        # Local record of synced hashes/revs (sync_down/sync_up work without it, hashing every time)
+        self.manifest = SyncManifest(manifest_path) if manifest_path else None
     
     def check_connection(self):
         try:
@@ -25,54 +112,197 @@ class DropboxManager:
         except Exception as e:
             return False, str(e)
 
-    def download_file(self, dropbox_path, local_path):
-        """Downloads a file from Dropbox to local path atomically."""
+    def download_file(self, dropbox_path, local_path, progress=None, chunk_size=DOWNLOAD_CHUNK_SIZE):
+        """
+        Downloads a file from Dropbox to local path atomically.
+
+        The body is streamed in chunks to a temp file next to local_path and
+        renamed over it only once complete, so memory stays flat whatever
+        the file size and a failed transfer never leaves a partial file.
+        progress(bytes_done, bytes_total) is called after every chunk.
+        """
+        tmp_path = None
+        res = None
         try:
-            # Metadata check
+            # A missing file is reported by the download call itself (no separate metadata round trip)
             try:
-                self.dbx.files_get_metadata(dropbox_path)
+                metadata, res = self.dbx.files_download(path=dropbox_path)
             except dropbox.exceptions.ApiError as e:
                 if e.error.is_path() and e.error.get_path().is_not_found():
                     return False, "File not found in Dropbox"
                 raise e
 
-            # Download to memory first
-            metadata, res = self.dbx.files_download(path=dropbox_path)
-            content = res.content
-            
-            if not content:
-                # If content is empty strings but metadata exists, we might decide to skip
-                # for safety, or proceed if 0-byte files are allowed. 
-                # For this app, we prefer safety.
-                pass 
-
             # Ensure local directory exists
-            os.makedirs(os.path.dirname(local_path), exist_ok=True)
-            
-            # Write only after full download
-            with open(local_path, "wb") as f:
-                f.write(content)
-                
+            directory = os.path.dirname(local_path) or "."
+            os.makedirs(directory, exist_ok=True)
+
+            # Write to a temp file; replace the target only after the full download
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".dropbox-", suffix=".part")
+            done = 0
+            with os.fdopen(fd, "wb") as f:
+                for chunk in res.iter_content(chunk_size=chunk_size):
+                    f.write(chunk)
+                    done += len(chunk)
+                    if progress:
+                        progress(done, metadata.size)
+            os.replace(tmp_path, local_path)
+            tmp_path = None
+            self._record(dropbox_path, local_path, metadata)
+
             return True, f"Downloaded {dropbox_path}"
         except Exception as e:
             return False, f"Error downloading: {str(e)}"
+        finally:
+            if res is not None:
+                res.close()
+            if tmp_path is not None and os.path.exists(tmp_path):
+                os.remove(tmp_path)
 
-    def upload_file(self, local_path, dropbox_path):
-        """Uploads a local file to Dropbox, overwriting if exists, with safety checks."""
+    def upload_file(self, local_path, dropbox_path, progress=None, chunk_size=UPLOAD_CHUNK_SIZE):
+        """
+        Uploads a local file to Dropbox, overwriting if exists, with safety checks.
+
+        Files up to chunk_size go in a single files_upload call; larger ones
+        through an upload session, one chunk at a time, so only one chunk is
+        in memory and the 150 MB limit of files_upload does not apply.
+        progress(bytes_done, bytes_total) is called after every chunk.
+        """
         try:
             if not os.path.exists(local_path):
                 return False, "Local file does not exist"
-            
+
             # SAFEGUARD: Do not upload if file is tiny (likely header-only or corrupted)
-            if os.path.getsize(local_path) < 50:
-                return False, f"File too small ({os.path.getsize(local_path)} bytes). Upload aborted for safety."
+            size = os.path.getsize(local_path)
+            if size < 50:
+                return False, f"File too small ({size} bytes). Upload aborted for safety."
 
+            mode = dropbox.files.WriteMode.overwrite
             with open(local_path, "rb") as f:
-                self.dbx.files_upload(
-                    f.read(),
-                    dropbox_path,
-                    mode=dropbox.files.WriteMode.overwrite
-                )
+                if size <= chunk_size:
+                    metadata = self.dbx.files_upload(f.read(), dropbox_path, mode=mode)
+                    if progress:
+                        progress(size, size)
+                    self._record(dropbox_path, local_path, metadata)
+                    return True, f"Uploaded {dropbox_path}"
+
+                session = self.dbx.files_upload_session_start(f.read(chunk_size))
+                cursor = dropbox.files.UploadSessionCursor(session_id=session.session_id, offset=f.tell())
+                if progress:
+                    progress(cursor.offset, size)
+                while size - cursor.offset > chunk_size:
+                    self.dbx.files_upload_session_append_v2(f.read(chunk_size), cursor)
+                    cursor.offset = f.tell()
+                    if progress:
+                        progress(cursor.offset, size)
+                commit = dropbox.files.CommitInfo(path=dropbox_path, mode=mode)
+                metadata = self.dbx.files_upload_session_finish(f.read(), cursor, commit)
+                if progress:
+                    progress(size, size)
+            self._record(dropbox_path, local_path, metadata)
             return True, f"Uploaded {dropbox_path}"
         except Exception as e:
             return False, f"Error uploading: {str(e)}"
+
+    def _record(self, dropbox_path, local_path, metadata):
+        if self.manifest is not None:
+            self.manifest.record(dropbox_path, local_path, metadata)
+
+    def _local_hash(self, dropbox_path, local_path):
+        if self.manifest is not None:
+            return self.manifest.local_hash(dropbox_path, local_path)
+        return content_hash(local_path)
+
+    def list_folder(self, folder=""):
+        """
+        Metadata of the files directly inside a Dropbox folder ("" is the
+        root), keyed by lowercase path. One files_list_folder call, plus one
+        continue call per further page of a very large folder. A folder that
+        does not exist yields an empty dict.
+        """
+        try:
+            result = self.dbx.files_list_folder(folder)
+        except dropbox.exceptions.ApiError as e:
+            if e.error.is_path() and e.error.get_path().is_not_found():
+                return {}
+            raise e
+        entries = list(result.entries)
+        while result.has_more:
+            result = self.dbx.files_list_folder_continue(result.cursor)
+            entries.extend(result.entries)
+        return {
+            entry.path_lower: entry for entry in entries
+            if isinstance(entry, dropbox.files.FileMetadata)
+        }
+
+    def _remote_metadata(self, dropbox_paths):
+        """FileMetadata (or None) per path, listing each parent folder once."""
+        listings = {}
+        remote = {}
+        for path in dropbox_paths:
+            folder = posixpath.dirname(path.lower()).rstrip("/")
+            if folder not in listings:
+                listings[folder] = self.list_folder(folder)
+            remote[path] = listings[folder].get(path.lower())
+        return remote
+
+    def sync_down(self, files, progress=None):
+        """
+        Downloads only the files whose Dropbox content differs from the local copy.
+
+        Args:
+            files: (dropbox_path, local_path) pairs.
+            progress: Passed to download_file for the files transferred.
+
+        Returns:
+            dict of dropbox_path -> (ok, msg). Unchanged files are (True, "Unchanged ...").
+            With every file up to date this costs one metadata call per folder.
+        """
+        results = {}
+        try:
+            remote = self._remote_metadata([dropbox_path for dropbox_path, _ in files])
+        except Exception as e:
+            return {dropbox_path: (False, f"Error listing Dropbox: {str(e)}") for dropbox_path, _ in files}
+        for dropbox_path, local_path in files:
+            metadata = remote[dropbox_path]
+            if metadata is None:
+                results[dropbox_path] = (False, "File not found in Dropbox")
+                continue
+            try:
+                if (os.path.exists(local_path)
+                        and self._local_hash(dropbox_path, local_path) == metadata.content_hash):
+                    self._record(dropbox_path, local_path, metadata)
+                    results[dropbox_path] = (True, f"Unchanged {dropbox_path}")
+                    continue
+            except OSError:
+                pass
+            results[dropbox_path] = self.download_file(dropbox_path, local_path, progress=progress)
+        return results
+
+    def sync_up(self, files, progress=None):
+        """
+        Uploads only the local files whose content differs from Dropbox.
+
+        Args:
+            files: (local_path, dropbox_path) pairs.
+            progress: Passed to upload_file for the files transferred.
+
+        Returns:
+            dict of dropbox_path -> (ok, msg), as sync_down.
+        """
+        results = {}
+        try:
+            remote = self._remote_metadata([dropbox_path for _, dropbox_path in files])
+        except Exception as e:
+            return {dropbox_path: (False, f"Error listing Dropbox: {str(e)}") for _, dropbox_path in files}
+        for local_path, dropbox_path in files:
+            metadata = remote[dropbox_path]
+            try:
+                if (metadata is not None and os.path.exists(local_path)
+                        and self._local_hash(dropbox_path, local_path) == metadata.content_hash):
+                    self._record(dropbox_path, local_path, metadata)
+                    results[dropbox_path] = (True, f"Unchanged {dropbox_path}")
+                    continue
+            except OSError:
+                pass
+            results[dropbox_path] = self.upload_file(local_path, dropbox_path, progress=progress)
+        return results
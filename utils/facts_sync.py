@@ -0,0 +1,191 @@
+import threading
+import time
+from urllib.parse import quote
+
+import pandas as pd
+
+FACTS_SELECT = "*,categories(name)"
+
+
+class FactsSync:
+    """
+    Keeps a resident copy of the facts table in sync with the server.
+
+    The first refresh downloads the whole table. Later refreshes only ask
+    for rows changed since the last-seen watermark and merge them by id,
+    so a refresh costs roughly as much as the change:
+
+    - With an ``updated_at`` column, rows with ``updated_at >= watermark``
+      are fetched (``>=`` so rows sharing the last timestamp are not lost;
+      the merge by id makes the overlap harmless).
+    - Without it, only new rows are fetched (``id > max id``).
+    - Rows whose ``deleted_at`` is set are tombstones and are removed.
+
+    With a transform, fetched rows are converted once, as they arrive, and
+    the resident frame is kept in the converted layout (e.g. the compact
+    app layout of utils.data_context.preparar_facts). Categorical columns
+    stay categorical across merges. When nothing changed, refresh() hands
+    back the same frame object, so callers can skip re-processing it.
+
+    Hard deletes are picked up by the periodic full resync, which is also
+    forced when categories are written through the client (their names are
+    embedded in facts). Without ``updated_at`` a delta cannot see edits, so
+    edits written through the client and invalidate() force a full resync
+    too; edits made elsewhere wait for the periodic one.
+
+    Args:
+        sdb: SupabaseDB client.
+        select: PostgREST select used for facts.
+        watermark_column: Timestamp column bumped on every insert/update.
+        deleted_column: Soft-delete column used as tombstone.
+        full_resync_every: Seconds between full resyncs (safety net).
+        min_interval: Seconds to reuse the resident copy before asking the
+            server again, unless facts were written through sdb meanwhile.
+        transform: Optional callable converting raw rows (server column
+            names) into the resident layout; it must keep the 'id' column.
+    """
+
+    def __init__(self, sdb, select=FACTS_SELECT, watermark_column="updated_at",
+                 deleted_column="deleted_at", full_resync_every=3600, min_interval=30,
+                 transform=None):
+        self.sdb = sdb
+        self.select = select
+        self.transform = transform
+        self.watermark_column = watermark_column
+        self.deleted_column = deleted_column
+        self.full_resync_every = full_resync_every
+        self.min_interval = min_interval
+
+        self.frame = None
+        self.watermark = None
+        self.max_id = None
+        self._last_full = 0.0
+        self._last_check = 0.0
+        self._seen_versions = None
+        self._invalidated = False
+        self._lock = threading.Lock()
+        self.stats = {"full_syncs": 0, "delta_syncs": 0, "rows_fetched": 0, "rows_deleted": 0}
+
+    def _versions(self):
+        return (self.sdb.table_version("facts"), self.sdb.table_version("categories"),
+                self.sdb.table_version("facts", edits_only=True))
+
+    def invalidate(self):
+        """
+        Makes the next refresh ask the server for changes right away (a full
+        read when there is no watermark, since a delta would miss edits).
+        """
+        self._last_check = 0.0
+        self._invalidated = True
+
+    def refresh(self, force_full=False):
+        """Returns the up-to-date facts frame (raw server columns, or the transform's layout)."""
+        with self._lock:
+            now = time.monotonic()
+            versions = self._versions()
+            categories_written = self._seen_versions is not None and versions[1] != self._seen_versions[1]
+            own_write = self._seen_versions is not None and versions != self._seen_versions
+            own_edit = self._seen_versions is not None and versions[2] != self._seen_versions[2]
+            # Without a watermark a delta only sees new ids: edits need a full read
+            edits_unseen = self.watermark is None and (own_edit or self._invalidated)
+
+            if (self.frame is None or force_full or categories_written or edits_unseen
+                    or now - self._last_full > self.full_resync_every):
+                self._full_sync()
+            elif own_write or now - self._last_check > self.min_interval:
+                self._delta_sync()
+            self._seen_versions = versions
+            self._invalidated = False
+            return self.frame
+
+    def _convert(self, df):
+        return self.transform(df) if self.transform is not None else df
+
+    def _drop_tombstones(self, df):
+        if self.deleted_column in df.columns:
+            tombstones = df[self.deleted_column].notna()
+            return df[~tombstones], df.loc[tombstones, 'id']
+        return df, pd.Series([], dtype='int64')
+
+    def _advance_watermark(self, df):
+        if df.empty:
+            return
+        if self.watermark_column in df.columns:
+            latest = df[self.watermark_column].dropna().max()
+            if pd.notna(latest) and (self.watermark is None or latest > self.watermark):
+                self.watermark = latest
+        latest_id = df['id'].max()
+        if self.max_id is None or latest_id > self.max_id:
+            self.max_id = latest_id
+
+    def _full_sync(self):
+        # Errors propagate: a failed read must not replace the resident copy with an empty frame
+        df = self.sdb.query_all("facts", select=self.select, use_cache=False, raise_errors=True)
+        alive, _ = self._drop_tombstones(df)
+        self.frame = self._convert(alive.reset_index(drop=True))
+        self.watermark = None
+        self.max_id = None
+        self._advance_watermark(df)
+        now = time.monotonic()
+        self._last_full = self._last_check = now
+        self.stats["full_syncs"] += 1
+        self.stats["rows_fetched"] += len(df)
+
+    def _delta_sync(self):
+        if self.watermark is not None:
+            filters = {self.watermark_column: f"gte.{quote(str(self.watermark))}"}
+        elif self.max_id is not None:
+            filters = {"id": f"gt.{self.max_id}"}
+        else:
+            filters = None
+        delta = self.sdb.query_all("facts", select=self.select, filters=filters, use_cache=False,
+                                   raise_errors=True)
+        self._last_check = time.monotonic()
+        self.stats["delta_syncs"] += 1
+        self.stats["rows_fetched"] += len(delta)
+        if delta.empty:
+            return
+
+        alive, deleted_ids = self._drop_tombstones(delta)
+        self._advance_watermark(delta)
+        rows = self._convert(alive.reset_index(drop=True))
+        if self.frame.empty:
+            self.frame = rows.sort_values('id', kind='stable').reset_index(drop=True)
+            return
+        if not self.frame['id'].isin(deleted_ids).any() and self._unchanged(rows):
+            # The >= watermark overlap re-sends the latest rows: keep the same frame object
+            return
+        keep = ~self.frame['id'].isin(delta['id'])
+        self.stats["rows_deleted"] += int(self.frame['id'].isin(deleted_ids).sum())
+        if rows.empty:
+            self.frame = self.frame[keep].reset_index(drop=True)
+            return
+        merged = _concat_keeping_categories(self.frame[keep], rows)
+        self.frame = merged.sort_values('id', kind='stable').reset_index(drop=True)
+
+    def _unchanged(self, rows):
+        """True when every row is already resident with the same values."""
+        if rows.empty:
+            return True
+        current = self.frame[self.frame['id'].isin(rows['id'])]
+        if len(current) != len(rows) or list(rows.columns) != list(current.columns):
+            return False
+
+        def values(df):
+            return df.sort_values('id').astype(object).reset_index(drop=True)
+        return values(current).equals(values(rows))
+
+
+def _concat_keeping_categories(base, rows):
+    """
+    Appends rows to base; columns that are categorical in base stay
+    categorical (pd.concat falls back to object when categories differ).
+    """
+    base, rows = base.copy(deep=False), rows.copy(deep=False)
+    for column in base.columns:
+        if isinstance(base[column].dtype, pd.CategoricalDtype) and column in rows.columns:
+            categories = base[column].cat.categories.union(pd.Index(rows[column].dropna().unique()))
+            dtype = pd.CategoricalDtype(categories)
+            base[column] = base[column].cat.set_categories(categories)
+            rows[column] = rows[column].astype(object).astype(dtype)
+    return pd.concat([base, rows], ignore_index=True)
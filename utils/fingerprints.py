@@ -0,0 +1,205 @@
+import hashlib
+import threading
+import unicodedata
+from collections import defaultdict
+
+import numpy as np
+import pandas as pd
+
+from utils.row_tracker import RowTracker
+
+
+def normalize_details(details):
+    """
+    Case- and accent-folds movement details and collapses whitespace.
+
+    Only distinct values are normalized, so long statements with repeated
+    merchants cost one unicodedata pass per merchant.
+    """
+    details = pd.Series(details).fillna('').astype(str)
+    codes, uniques = pd.factorize(details)
+    folded = [
+        " ".join(unicodedata.normalize('NFKD', d).encode('ascii', 'ignore').decode().casefold().split())
+        for d in uniques
+    ]
+    return pd.Series(pd.Index(folded, dtype=object).take(codes), index=details.index)
+
+
+def movement_keys(dates, details, amounts, banks):
+    """
+    Canonical 'date|detail|amount|bank' key of each movement (before the
+    occurrence index). dates must be datetimes; details are normalized.
+    """
+    dates = pd.to_datetime(pd.Series(dates), errors='coerce')
+    amounts = pd.to_numeric(pd.Series(amounts), errors='coerce').fillna(0).round(2)
+    return (
+        dates.dt.strftime('%Y-%m-%d').fillna('').reset_index(drop=True)
+        + '|' + normalize_details(details).reset_index(drop=True)
+        + '|' + amounts.map('{:.2f}'.format).reset_index(drop=True)
+        + '|' + pd.Series(banks).astype(object).fillna('').astype(str).str.strip().reset_index(drop=True)
+    )
+
+
+def _fingerprints_for_keys(keys, occurrence=None):
+    if occurrence is None:
+        occurrence = keys.groupby(keys, sort=False).cumcount()
+    full_keys = keys + '|' + pd.Series(occurrence, index=keys.index).astype(str)
+    return pd.Series(
+        [hashlib.blake2b(k.encode(), digest_size=16).hexdigest() for k in full_keys],
+        index=keys.index,
+    )
+
+
+def movement_fingerprints(dates, details, amounts, banks):
+    """
+    Deterministic fingerprint per movement: hash of date, normalized detail,
+    amount, bank and occurrence index.
+
+    The occurrence index numbers identical movements within the batch
+    (0, 1, ...) so two genuine same-day purchases stay distinct, while
+    importing an overlapping statement again yields the same fingerprints.
+
+    Returns:
+        pd.Series of 32-char hex strings, aligned positionally with the inputs.
+    """
+    return _fingerprints_for_keys(movement_keys(dates, details, amounts, banks))
+
+
+class FingerprintIndex:
+    """
+    Hash index over stored facts for duplicate detection at import time.
+
+    Exact duplicates are found with one dict lookup per new movement
+    (fingerprint -> fact id). Near-duplicates (same amount and normalized
+    detail, date within +/- near_days) are found through a second dict
+    keyed by amount, so each probe only looks at the few stored movements
+    with that exact amount.
+
+    The index is built once and kept in sync incrementally: sync() only
+    re-indexes facts that are new, gone or whose date/detail/amount/bank
+    changed (see utils.row_tracker).
+
+    Args:
+        near_days: Date window for near-duplicates.
+    """
+
+    COLUMNS = ['Fecha_dt', 'Detalle', 'Monto', 'Banco']
+
+    def __init__(self, near_days=3):
+        self.near_days = near_days
+        self._exact = {}                       # fingerprint -> id
+        self._by_amount = defaultdict(dict)    # amount key -> {id: (day number, detail)}
+        self._entries = {}                     # id -> (fingerprint, amount key, movement key, occurrence)
+        self._changes = RowTracker(self.COLUMNS)
+        self._occurrences = defaultdict(set)   # movement key -> occurrence indexes held by stored facts
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def _amount_keys(amounts):
+        return (pd.to_numeric(pd.Series(amounts), errors='coerce').fillna(0) * 100).round().astype('int64')
+
+    @staticmethod
+    def _day_numbers(dates):
+        """Days since epoch as Python ints (None for missing dates)."""
+        dates = pd.to_datetime(pd.Series(dates), errors='coerce')
+        days = dates.to_numpy(dtype='datetime64[ns]').astype('datetime64[D]').astype('int64')
+        return [int(d) if ok else None for d, ok in zip(days, dates.notna().to_numpy())]
+
+    def sync(self, facts):
+        """Brings the index in line with facts (app layout: id, Fecha_dt, Detalle, Monto, Banco)."""
+        with self._lock:
+            changes = self._changes.diff(facts)
+            self._remove(changes.removed)
+            if changes.added.any():
+                self._add(facts[changes.added])
+
+    def _remove(self, ids):
+        for fact_id in ids:
+            fingerprint, amount_key, key, occurrence = self._entries.pop(fact_id)
+            if self._exact.get(fingerprint) == fact_id:
+                del self._exact[fingerprint]
+            self._by_amount[amount_key].pop(fact_id, None)
+            held = self._occurrences[key]
+            held.discard(occurrence)
+            if not held:
+                del self._occurrences[key]
+
+    def _allocate(self, keys):
+        """
+        Occurrence index of each new fact: numbered within the batch, skipping
+        the indexes already held by stored facts with the same movement key.
+        A fact removed and re-added (e.g. after a case-only edit of Detalle)
+        thus gets its old index back and keeps the same fingerprint.
+        """
+        occurrence = keys.groupby(keys, sort=False).cumcount().to_numpy()
+        held = keys.isin(list(self._occurrences)).to_numpy()
+        if held.any():
+            held_positions = np.flatnonzero(held)
+            held_keys = keys[held]
+            for key, positions in held_keys.groupby(held_keys, sort=False).indices.items():
+                taken = self._occurrences[key]
+                free = []
+                candidate = 0
+                while len(free) < len(positions):
+                    if candidate not in taken:
+                        free.append(candidate)
+                    candidate += 1
+                occurrence[held_positions[positions]] = free
+        return occurrence
+
+    def _add(self, facts):
+        keys = movement_keys(facts['Fecha_dt'], facts['Detalle'], facts['Monto'], facts['Banco'])
+        occurrences = self._allocate(keys)
+        computed = _fingerprints_for_keys(keys, occurrences)
+        if 'fingerprint' in facts.columns:
+            # Facts imported with a stored fingerprint keep it; legacy rows use the computed one.
+            # The resident frame holds it as 16 raw bytes (see utils.data_context.compactar_facts)
+            stored = pd.Series([v.hex() if isinstance(v, bytes) else v for v in facts['fingerprint']],
+                               index=computed.index, dtype=object)
+            computed = stored.where(stored.notna(), computed)
+
+        details = normalize_details(facts['Detalle']).to_numpy()
+        ordinals = self._day_numbers(facts['Fecha_dt'])
+        amount_keys = self._amount_keys(facts['Monto']).to_numpy()
+        for fact_id, fingerprint, amount_key, ordinal, detail, key, occurrence in zip(
+                facts['id'].to_numpy(), computed.to_numpy(), amount_keys, ordinals, details,
+                keys.to_numpy(), occurrences.tolist()):
+            self._entries[fact_id] = (fingerprint, amount_key, key, occurrence)
+            self._occurrences[key].add(occurrence)
+            self._exact[fingerprint] = fact_id
+            if ordinal is not None:
+                self._by_amount[amount_key][fact_id] = (ordinal, detail)
+
+    def probe(self, dates, details, amounts, banks):
+        """
+        Checks new movements against the index.
+
+        Returns:
+            pd.DataFrame (positional index) with 'dup_id' (id of the stored
+            exact duplicate or None) and 'near_ids' (ids of near-duplicates).
+        """
+        fingerprints = movement_fingerprints(dates, details, amounts, banks)
+        norm = normalize_details(details).to_numpy()
+        ordinals = self._day_numbers(dates)
+        amount_keys = self._amount_keys(amounts).to_numpy()
+
+        dup_ids, near_ids = [], []
+        with self._lock:
+            for fingerprint, ordinal, detail, amount_key in zip(fingerprints, ordinals, norm, amount_keys):
+                exact = self._exact.get(fingerprint)
+                dup_ids.append(exact)
+                near = []
+                if ordinal is not None:
+                    for fact_id, (stored_ordinal, stored_detail) in self._by_amount.get(amount_key, {}).items():
+                        if (fact_id != exact and stored_detail == detail
+                                and abs(stored_ordinal - ordinal) <= self.near_days):
+                            near.append(fact_id)
+                near_ids.append(near)
+        # Explicit object dtype: an empty statement would otherwise yield float64 columns
+        return pd.DataFrame({
+            'dup_id': pd.Series(dup_ids, dtype=object),
+            'near_ids': pd.Series(near_ids, dtype=object),
+        })
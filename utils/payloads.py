@@ -0,0 +1,144 @@
+import pandas as pd
+
+from utils.date_utils import get_accounting_months
+from utils.fingerprints import movement_fingerprints
+
+
+def _nullable(series):
+    """Object Series with None instead of NaN/NA, ready for JSON."""
+    return series.astype(object).where(series.notna(), None)
+
+
+def changed_rows(original, edited, key="id", columns=None):
+    """
+    Returns the rows of edited whose values differ from original.
+
+    Rows are matched on key (rows without a key, e.g. added in the editor,
+    are ignored) and compared column-wise in one vectorized pass; two
+    missing values count as equal.
+
+    Args:
+        original: Frame shown in the editor.
+        edited: Frame returned by the editor.
+        key: Column identifying a row.
+        columns: Columns to compare (defaults to the shared ones).
+
+    Returns:
+        pd.DataFrame: Changed rows of edited, in edited's order.
+    """
+    edited = edited[edited[key].notna()]
+    if columns is None:
+        columns = [c for c in edited.columns if c != key and c in original.columns]
+    before = original.drop_duplicates(key).set_index(key)[columns]
+    after = edited.set_index(key)[columns]
+    before = before.reindex(after.index)
+
+    same = (after == before) | (after.isna() & before.isna())
+    is_changed = ~same.all(axis=1) & after.index.isin(original[key])
+    return edited[is_changed.to_numpy()]
+
+
+def facts_update_payloads(changed, cat_to_id, fallback_dates=None, status="Conciliado"):
+    """
+    Builds facts upsert payloads for rows edited in the conciliation editor.
+
+    Args:
+        changed: Editor rows (id, Fecha, Detalle, Monto, Banco, Categoria).
+        cat_to_id: Category name -> id.
+        fallback_dates: Dates (aligned with changed) used when Fecha does not parse.
+        status: Status written to every row.
+
+    Returns:
+        (payloads, invalid): list of dicts for bulk upsert, and the ids that
+        were skipped because their date or amount is missing.
+    """
+    fechas = pd.to_datetime(changed['Fecha'], dayfirst=True, format='mixed', errors='coerce')
+    if fallback_dates is not None:
+        fechas = fechas.fillna(pd.to_datetime(fallback_dates, errors='coerce'))
+    montos = pd.to_numeric(changed['Monto'], errors='coerce')
+
+    valid = (fechas.notna() & montos.notna()).to_numpy()
+    invalid_ids = changed.loc[~valid, 'id'].tolist()
+    changed, fechas, montos = changed[valid], fechas[valid], montos[valid]
+
+    payload = pd.DataFrame({
+        "id": changed['id'].astype('int64'),
+        "date": fechas.dt.strftime('%Y-%m-%d'),
+        "period": get_accounting_months(fechas),
+        "detail": changed['Detalle'],
+        "amount": montos,
+        "bank": changed['Banco'],
+        "category_id": _nullable(changed['Categoria'].map(cat_to_id).astype('Int64')),
+        "status": status,
+    })
+    return payload.to_dict('records'), invalid_ids
+
+
+def facts_insert_payloads(df, cat_to_id, status="Pendiente", keep=None):
+    """
+    Builds facts payloads for a normalized cartola (Fecha as DD-MM-YYYY).
+
+    Every row carries a fingerprint (see utils.fingerprints) so inserts can
+    use on_conflict=fingerprint and re-importing overlapping statements
+    does not duplicate movements. Rows whose date does not parse are skipped.
+
+    keep (boolean mask aligned with df) drops rows after fingerprinting, so
+    skipping known duplicates does not shift the occurrence index of the rest.
+
+    Returns:
+        (payloads, n_invalid)
+    """
+    fechas = pd.to_datetime(df['Fecha'], format='%d-%m-%Y', errors='coerce')
+    valid = fechas.notna().to_numpy()
+    df, fechas = df[valid], fechas[valid]
+    categorias = df['Categoria'] if 'Categoria' in df.columns else pd.Series('Pendiente', index=df.index)
+
+    payload = pd.DataFrame({
+        "date": fechas.dt.strftime('%Y-%m-%d'),
+        "period": get_accounting_months(fechas),
+        "detail": df['Detalle'].astype(str),
+        "amount": pd.to_numeric(df['Monto'], errors='coerce').fillna(0),
+        "bank": df['Banco'],
+        "category_id": _nullable(categorias.map(cat_to_id).astype('Int64')),
+        "status": status,
+        "fingerprint": movement_fingerprints(fechas, df['Detalle'], df['Monto'], df['Banco']).to_numpy(),
+    })
+    if keep is not None:
+        payload = payload[pd.Series(keep).to_numpy()[valid]]
+    return payload.to_dict('records'), int((~valid).sum())
+
+
+def fingerprint_backfill_payloads(facts):
+    """
+    Builds facts upsert payloads that store a fingerprint on rows created
+    without one (e.g. by migrate_v2.py).
+
+    Fingerprints are computed over every row in id order, so the occurrence
+    index matches what FingerprintIndex derives for these rows at runtime.
+    A computed fingerprint already held by another row (a duplicate kept on
+    purpose) is left out, so the unique key on facts.fingerprint still holds.
+
+    Args:
+        facts: Raw facts rows (id, date, period, detail, amount, bank,
+            category_id, status, fingerprint).
+
+    Returns:
+        (payloads, n_conflicts)
+    """
+    facts = facts.sort_values('id', kind='stable').reset_index(drop=True)
+    stored = facts['fingerprint'] if 'fingerprint' in facts.columns else pd.Series(None, index=facts.index)
+    computed = movement_fingerprints(pd.to_datetime(facts['date'], errors='coerce'),
+                                     facts['detail'], facts['amount'], facts['bank'])
+    missing = stored.isna()
+    taken = set(stored[~missing])
+    conflicts = missing & computed.isin(taken)
+    todo = missing & ~conflicts
+
+    rows = facts[todo]
+    payload = pd.DataFrame({
+        "id": rows['id'].astype('int64'),
+        **{column: _nullable(rows[column]) for column in ['date', 'period', 'detail', 'amount', 'bank', 'status']},
+        "category_id": _nullable(pd.to_numeric(rows['category_id'], errors='coerce').astype('Int64')),
+        "fingerprint": computed[todo],
+    })
+    return payload.to_dict('records'), int(conflicts.sum())
@@ -0,0 +1,246 @@
+import contextvars
+import functools
+import json
+import logging
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_COLUMNS = ['span', 'calls', 'total_ms', 'max_ms', 'rows', 'bytes']
+
+
+class _NullSpan:
+    """Span handed out while tracing is disabled: does nothing, is falsy."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def __bool__(self):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ('tracer', 'name', 'attrs', 'start')
+
+    def __init__(self, tracer, name, attrs):
+        self.tracer = tracer
+        self.name = name
+        self.attrs = attrs
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.attrs['error'] = exc_type.__name__
+        self.tracer._record(self.name, self.start, time.perf_counter() - self.start, self.attrs)
+        return False
+
+    def __bool__(self):
+        return True
+
+    def set(self, **attrs):
+        """Adds attributes known only inside the span (rows, bytes, status...)."""
+        self.attrs.update(attrs)
+
+
+class Tracer:
+    """
+    Collects timing spans of one session, grouped per rerun.
+
+    Code marks hot sections with span() (or the @traced decorator), and
+    the tracer bound to the running script (see activate) records their
+    duration, thread and attributes such as rows or bytes. Spans are kept
+    for the last max_runs reruns and also folded into per-session totals.
+    Each finished span is logged as one JSON line on this module's logger
+    at DEBUG level, and export() dumps the retained reruns as a Chrome
+    trace (chrome://tracing, Perfetto).
+
+    While disabled, span() returns a shared no-op object, so instrumented
+    code pays one context-variable lookup and one attribute check.
+
+    Args:
+        enabled: Start recording right away.
+        max_runs: Reruns whose individual spans are kept.
+    """
+
+    def __init__(self, enabled=False, max_runs=20):
+        self.enabled = enabled
+        self.runs = deque(maxlen=max_runs)
+        self._session = {}      # span name -> [calls, total_s, max_s, rows, bytes]
+        self._origin = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def begin_run(self, label=""):
+        """Starts collecting the spans of a new rerun."""
+        if self.enabled:
+            with self._lock:
+                self.runs.append({
+                    "label": label,
+                    "started_at": datetime.now().isoformat(timespec="seconds"),
+                    "spans": [],
+                })
+
+    def span(self, name, **attrs):
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, attrs)
+
+    def _record(self, name, start, duration, attrs):
+        entry = {
+            "name": name,
+            "start": start - self._origin,
+            "duration": duration,
+            "thread": threading.current_thread().name,
+            **attrs,
+        }
+        with self._lock:
+            if not self.runs:
+                self.runs.append({"label": "", "started_at": datetime.now().isoformat(timespec="seconds"),
+                                  "spans": []})
+            self.runs[-1]["spans"].append(entry)
+            totals = self._session.setdefault(name, [0, 0.0, 0.0, 0, 0])
+            totals[0] += 1
+            totals[1] += duration
+            totals[2] = max(totals[2], duration)
+            totals[3] += attrs.get("rows") or 0
+            totals[4] += attrs.get("bytes") or 0
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(json.dumps(entry, default=str))
+
+    def reset(self):
+        """Drops every recorded span and the session totals."""
+        with self._lock:
+            self.runs.clear()
+            self._session.clear()
+
+    @staticmethod
+    def _summary_frame(rows):
+        df = pd.DataFrame(rows, columns=SUMMARY_COLUMNS)
+        return df.sort_values('total_ms', ascending=False, ignore_index=True)
+
+    def run_summary(self, index=-1):
+        """Per-span totals of one retained rerun (default: the latest)."""
+        with self._lock:
+            if not self.runs:
+                return self._summary_frame([])
+            spans = list(self.runs[index]["spans"])
+        if not spans:
+            return self._summary_frame([])
+        df = pd.DataFrame(spans).reindex(columns=['name', 'duration', 'rows', 'bytes'])
+        grouped = df.groupby('name').agg(
+            calls=('duration', 'size'), total_s=('duration', 'sum'), max_s=('duration', 'max'),
+            rows=('rows', 'sum'), total_bytes=('bytes', 'sum'))
+        return self._summary_frame([
+            (name, int(g.calls), g.total_s * 1000, g.max_s * 1000, int(g.rows), int(g.total_bytes))
+            for name, g in grouped.iterrows()
+        ])
+
+    def session_summary(self):
+        """Per-span totals since the session started (or since reset)."""
+        with self._lock:
+            items = [(name, *totals) for name, totals in self._session.items()]
+        return self._summary_frame([
+            (name, calls, total * 1000, peak * 1000, rows, size)
+            for name, calls, total, peak, rows, size in items
+        ])
+
+    def export(self):
+        """Retained reruns as Chrome trace-event JSON (one complete event per span)."""
+        events = []
+        thread_ids = {}
+        with self._lock:
+            runs = [dict(run, spans=list(run["spans"])) for run in self.runs]
+        for number, run in enumerate(runs):
+            for span in run["spans"]:
+                tid = thread_ids.setdefault(span["thread"], len(thread_ids))
+                args = {k: v for k, v in span.items() if k not in ("name", "start", "duration", "thread")}
+                events.append({
+                    "name": span["name"], "ph": "X", "pid": number, "tid": tid,
+                    "ts": span["start"] * 1e6, "dur": span["duration"] * 1e6, "args": args,
+                })
+            events.append({"name": "process_name", "ph": "M", "pid": number,
+                           "args": {"name": f"rerun {run['started_at']} {run['label']}".strip()}})
+            for thread, tid in thread_ids.items():
+                events.append({"name": "thread_name", "ph": "M", "pid": number, "tid": tid,
+                               "args": {"name": thread}})
+        return json.dumps({"traceEvents": events, "displayTimeUnit": "ms"}, default=str)
+
+
+_DISABLED = Tracer(enabled=False)
+_current = contextvars.ContextVar("perf_tracer", default=_DISABLED)
+
+
+def activate(tracer):
+    """Binds tracer to the running script (and to what propagate() hands to worker threads)."""
+    _current.set(tracer)
+
+
+def current():
+    return _current.get()
+
+
+def span(name, **attrs):
+    """
+    Times a block under the active tracer:
+
+        with span("supabase.http", method="GET") as s:
+            ...
+            if s:   # only when tracing, to skip computing attributes
+                s.set(rows=len(rows))
+    """
+    tracer = _current.get()
+    if not tracer.enabled:
+        return _NULL_SPAN
+    return _Span(tracer, name, attrs)
+
+
+def traced(name):
+    """Decorator recording every call of the function as a span."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            tracer = _current.get()
+            if not tracer.enabled:
+                return func(*args, **kwargs)
+            with _Span(tracer, name, {}):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def propagate(func):
+    """
+    Wraps func so it records under the caller's tracer when run in a
+    thread pool (worker threads do not inherit the script's context).
+    """
+    tracer = _current.get()
+    if not tracer.enabled:
+        return func
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        token = _current.set(tracer)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _current.reset(token)
+    return wrapper
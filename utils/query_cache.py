@@ -0,0 +1,89 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+
+# Embedded resources in a PostgREST select, e.g. "*,categories(name)"
+_EMBED_RE = re.compile(r"(\w+)\(")
+
+
+class QueryCache:
+    """
+    TTL + LRU cache for read results keyed by (table, select, filters).
+
+    Each entry remembers every table it depends on (the queried table plus
+    any resource embedded in the select), so a write to "categories" also
+    drops cached "facts?select=*,categories(name)" results, while a write
+    to "budget" leaves facts untouched.
+
+    Args:
+        ttl: Seconds an entry stays valid.
+        max_entries: LRU bound; the least recently used entry is evicted first.
+    """
+
+    def __init__(self, ttl=300, max_entries=128):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (expires_at, tables, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def make_key(kind, table, select="*", filters=None):
+        return (kind, table, select, tuple(sorted((filters or {}).items())))
+
+    @staticmethod
+    def tables_for(table, select="*"):
+        return frozenset([table, *_EMBED_RE.findall(select or "")])
+
+    def get(self, key):
+        """Returns the cached value or None if missing/expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, _, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, tables):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, tables, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, table):
+        """Drops every entry that depends on table. Returns how many were removed."""
+        with self._lock:
+            stale = [k for k, (_, tables, _) in self._entries.items() if table in tables]
+            for k in stale:
+                del self._entries[k]
+            self.invalidations += len(stale)
+            return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
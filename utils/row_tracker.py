@@ -0,0 +1,75 @@
+import weakref
+
+import numpy as np
+import pandas as pd
+
+_NO_IDS = np.array([], dtype='int64')
+
+
+class RowChanges:
+    """
+    What changed in a frame since the previous RowTracker.diff().
+
+    Attributes:
+        added: Boolean mask over the rows of the frame: rows whose id is new
+            or whose tracked columns changed (to be (re-)indexed).
+        removed: Ids seen before that are gone or changed (to be dropped
+            before re-adding the changed ones).
+    """
+
+    __slots__ = ('added', 'removed')
+
+    def __init__(self, added, removed):
+        self.added = added
+        self.removed = removed
+
+    def __bool__(self):
+        return bool(self.added.any()) or len(self.removed) > 0
+
+
+class RowTracker:
+    """
+    Detects new, gone and changed rows of a facts frame across syncs.
+
+    A vectorized hash of the tracked columns is kept per id; diff() compares
+    the current frame against it and remembers the new state. Passing the
+    same frame object again (views treat frames as read-only) returns no
+    changes without hashing it; only a weak reference to it is kept, so an
+    old full frame is not held alive by the tracker.
+
+    Args:
+        columns: Columns whose changes matter to the caller.
+    """
+
+    def __init__(self, columns):
+        self.columns = list(columns)
+        self._hashes = pd.Series(dtype='uint64')   # id -> row hash
+        self._source = None                         # weakref to the last frame diffed
+
+    def __len__(self):
+        return len(self._hashes)
+
+    def reset(self):
+        """Forgets every row, so the next diff() reports the whole frame as added."""
+        self._hashes = pd.Series(dtype='uint64')
+        self._source = None
+
+    def diff(self, facts):
+        """Changes of facts (needs id and the tracked columns) since the last call."""
+        if self._source is not None and self._source() is facts:
+            return RowChanges(np.zeros(len(facts), dtype=bool), _NO_IDS)
+        self._source = weakref.ref(facts)
+        if facts.empty or 'id' not in facts.columns:
+            removed = self._hashes.index.to_numpy()
+            self._hashes = pd.Series(dtype='uint64')
+            return RowChanges(np.zeros(len(facts), dtype=bool), removed)
+
+        ids = facts['id'].to_numpy()
+        current = pd.Series(pd.util.hash_pandas_object(facts[self.columns], index=False).to_numpy(), index=ids)
+        known = current.index.isin(self._hashes.index)
+        previous = self._hashes.reindex(ids, fill_value=0).to_numpy()
+        added = ~known | (previous != current.to_numpy())
+        gone = self._hashes.index.difference(current.index).to_numpy()
+        removed = np.concatenate([gone, ids[known & added]])
+        self._hashes = current
+        return RowChanges(added, removed)
@@ -0,0 +1,142 @@
+import bisect
+import re
+import threading
+from collections import defaultdict
+
+import numpy as np
+import pandas as pd
+
+from utils.fingerprints import normalize_details
+from utils.row_tracker import RowTracker
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text):
+    """Case- and accent-folded alphanumeric tokens of a text."""
+    folded = normalize_details(pd.Series([text])).iat[0]
+    return _TOKEN_RE.findall(folded)
+
+
+class DetailIndex:
+    """
+    Inverted token index over fact details, plus a sorted amount index.
+
+    Details are case- and accent-folded (see utils.fingerprints) and split
+    into alphanumeric tokens; each token maps to the set of fact ids that
+    contain it. A query token matches every indexed token that starts with
+    it (prefix) or, with substring=True, that contains it, which only scans
+    the vocabulary of distinct tokens, never the facts. Several query
+    tokens must all match (AND). Amount ranges are answered with a binary
+    search over the sorted amounts.
+
+    Tokenization runs once per distinct detail, and sync() only re-indexes
+    facts that are new, gone or whose Detalle/Monto changed.
+    """
+
+    COLUMNS = ['Detalle', 'Monto']
+
+    def __init__(self):
+        self._postings = defaultdict(set)   # token -> {id}
+        self._entries = {}                  # id -> tokens
+        self._changes = RowTracker(self.COLUMNS)
+        self._amounts = {}                  # id -> amount
+        self._vocabulary = None             # sorted tokens, rebuilt lazily
+        self._sorted_amounts = None         # (amounts, ids) sorted by amount, rebuilt lazily
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def sync(self, facts):
+        """Brings the index in line with facts (needs id, Detalle, Monto)."""
+        with self._lock:
+            changes = self._changes.diff(facts)
+            self._remove(changes.removed)
+            if changes.added.any():
+                self._add(facts[changes.added])
+
+    def _remove(self, ids):
+        if not len(ids):
+            return
+        for fact_id in ids:
+            tokens = self._entries.pop(fact_id)
+            for token in tokens:
+                posting = self._postings[token]
+                posting.discard(fact_id)
+                if not posting:
+                    del self._postings[token]
+            self._amounts.pop(fact_id, None)
+        self._vocabulary = self._sorted_amounts = None
+
+    def _add(self, facts):
+        codes, uniques = pd.factorize(normalize_details(facts['Detalle']))
+        tokens_by_code = [tuple(dict.fromkeys(_TOKEN_RE.findall(d))) for d in uniques]
+        ids = facts['id'].to_numpy()
+
+        # Postings are filled per distinct detail, not per fact
+        for code, positions in pd.Series(codes).groupby(codes).indices.items():
+            if code < 0:
+                continue
+            ids_with_detail = ids[positions].tolist()
+            for token in tokens_by_code[code]:
+                self._postings[token].update(ids_with_detail)
+
+        amounts = pd.to_numeric(facts['Monto'], errors='coerce').to_numpy(dtype='float64')
+        for fact_id, code, amount in zip(ids, codes, amounts):
+            self._entries[fact_id] = tokens_by_code[code] if code >= 0 else ()
+            self._amounts[fact_id] = amount
+        self._vocabulary = self._sorted_amounts = None
+
+    def _matching_tokens(self, query_token, substring):
+        if self._vocabulary is None:
+            self._vocabulary = sorted(self._postings)
+        if substring:
+            return [t for t in self._vocabulary if query_token in t]
+        start = bisect.bisect_left(self._vocabulary, query_token)
+        end = bisect.bisect_left(self._vocabulary, query_token + '￿')
+        return self._vocabulary[start:end]
+
+    def _ids_in_amount_range(self, min_amount, max_amount):
+        if self._sorted_amounts is None:
+            ids = np.fromiter(self._amounts.keys(), dtype='int64', count=len(self._amounts))
+            amounts = np.fromiter(self._amounts.values(), dtype='float64', count=len(self._amounts))
+            order = np.argsort(amounts, kind='stable')
+            self._sorted_amounts = (amounts[order], ids[order])
+        amounts, ids = self._sorted_amounts
+        start = 0 if min_amount is None else np.searchsorted(amounts, min_amount, side='left')
+        end = len(amounts) if max_amount is None else np.searchsorted(amounts, max_amount, side='right')
+        return set(ids[start:end].tolist())
+
+    def search(self, text=None, min_amount=None, max_amount=None, substring=False):
+        """
+        Ids of facts whose detail matches every token of text and whose
+        amount lies in [min_amount, max_amount] (bounds optional).
+
+        Returns:
+            np.ndarray of matching ids (sorted), or None when no criterion is
+            given. A text with no alphanumeric token (e.g. "-") matches nothing.
+        """
+        query_tokens = tokenize(text) if text else []
+        if text and not query_tokens:
+            return np.array([], dtype='int64')
+        if not query_tokens and min_amount is None and max_amount is None:
+            return None
+
+        with self._lock:
+            result = None
+            for query_token in query_tokens:
+                matches = set()
+                for token in self._matching_tokens(query_token, substring):
+                    matches |= self._postings[token]
+                result = matches if result is None else result & matches
+                if not result:
+                    return np.array([], dtype='int64')
+            if min_amount is not None or max_amount is not None:
+                in_range = self._ids_in_amount_range(min_amount, max_amount)
+                result = in_range if result is None else result & in_range
+        return np.array(sorted(result), dtype='int64')
+
+    def tokens(self, fact_id):
+        """Indexed tokens of one fact (empty tuple if unknown)."""
+        return self._entries.get(fact_id, ())
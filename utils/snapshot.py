@@ -0,0 +1,137 @@
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+# Bump when the layout of the persisted tables changes; older snapshots are ignored
+SNAPSHOT_VERSION = 3
+
+
+def _pandas_dtype(arrow_type):
+    # Fixed-width binary columns (facts.fingerprint) stay Arrow-backed instead of bytes objects
+    return pd.ArrowDtype(arrow_type) if pa.types.is_fixed_size_binary(arrow_type) else None
+
+
+class SnapshotStore:
+    """
+    Local columnar snapshot of the loaded, typed tables.
+
+    Each table is written as an uncompressed Arrow IPC (Feather v2) file so
+    it can be memory-mapped on load, and a manifest.json written last acts
+    as the version stamp: a snapshot is only served when the manifest
+    matches SNAPSHOT_VERSION and the same data source.
+
+    Args:
+        directory: Folder holding the snapshot files.
+        source: Identifier of the data source (e.g. the Supabase URL).
+    """
+
+    def __init__(self, directory, source=""):
+        self.directory = directory
+        self.source_id = hashlib.sha1(source.encode()).hexdigest()[:12]
+        self.manifest_path = os.path.join(directory, "manifest.json")
+
+    def _table_path(self, name):
+        return os.path.join(self.directory, f"{name}.arrow")
+
+    def load(self):
+        """Returns (tables, manifest) or (None, None) if there is no usable snapshot."""
+        try:
+            with open(self.manifest_path, "r") as f:
+                manifest = json.load(f)
+            if manifest.get("version") != SNAPSHOT_VERSION or manifest.get("source") != self.source_id:
+                return None, None
+            tables = {
+                name: feather.read_table(self._table_path(name), memory_map=True).to_pandas(types_mapper=_pandas_dtype)
+                for name in manifest["tables"]
+            }
+            return tables, manifest
+        except (OSError, ValueError, KeyError, pa.ArrowException):
+            return None, None
+
+    def save(self, tables, stamp=None):
+        """Writes every table atomically (tmp file + rename), then the manifest."""
+        os.makedirs(self.directory, exist_ok=True)
+        for name, df in tables.items():
+            path = self._table_path(name)
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            feather.write_feather(table, path + ".tmp", compression="uncompressed")
+            os.replace(path + ".tmp", path)
+        manifest = {
+            "version": SNAPSHOT_VERSION,
+            "source": self.source_id,
+            "saved_at": datetime.now().isoformat(timespec="seconds"),
+            "stamp": stamp,
+            "tables": sorted(tables),
+        }
+        with open(self.manifest_path + ".tmp", "w") as f:
+            json.dump(manifest, f)
+        os.replace(self.manifest_path + ".tmp", self.manifest_path)
+        return manifest
+
+
+class WarmStart:
+    """
+    Serves the local snapshot on cold start while the server is reconciled
+    in a background thread. The snapshot tables are released once the
+    reconciliation finishes.
+
+    Args:
+        store: SnapshotStore to read/write.
+        loader: Callable returning (tables, stamp) from the server; runs off the
+            script thread.
+    """
+
+    def __init__(self, store, loader):
+        self.store = store
+        self.loader = loader
+        self.tables, self.manifest = store.load()
+        self.ready = threading.Event()
+        self.error = None
+        self._saved_stamp = self.manifest.get("stamp") if self.manifest else None
+        self._saving = threading.Lock()
+
+    @property
+    def serving(self):
+        """True while the snapshot is shown and the server load has not finished."""
+        return self.tables is not None and not self.ready.is_set()
+
+    def start(self):
+        if self.tables is None:
+            self.ready.set()
+            return
+        threading.Thread(target=self._reconcile, name="snapshot-reconcile", daemon=True).start()
+
+    def _reconcile(self):
+        try:
+            tables, stamp = self.loader()
+            self.manifest = self.store.save(tables, str(stamp))
+            self._saved_stamp = str(stamp)
+        except Exception as e:
+            self.error = str(e)
+        finally:
+            # The snapshot was only needed until the live data is in: don't keep it alongside
+            self.tables = None
+            self.ready.set()
+
+    def save_async(self, tables, stamp):
+        """Persists tables in the background when stamp changed since the last save."""
+        stamp = str(stamp)
+        if stamp == self._saved_stamp or not self._saving.acquire(blocking=False):
+            return
+
+        def _save():
+            try:
+                self.manifest = self.store.save(tables, stamp)
+                self._saved_stamp = stamp
+            except Exception as e:
+                self.error = str(e)
+            finally:
+                self._saving.release()
+
+        threading.Thread(target=_save, name="snapshot-save", daemon=True).start()
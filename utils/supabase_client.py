@@ -0,0 +1,502 @@
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
+import pandas as pd
+import requests
+import streamlit as st
+from requests.adapters import HTTPAdapter
+
+from utils.perf import propagate, span
+from utils.query_cache import QueryCache
+
+# Status codes worth retrying: rate limiting and transient server/gateway errors
+RETRY_STATUS = {429, 500, 502, 503, 504}
+# Postgres error of an upsert whose on_conflict columns have no unique key
+NO_UNIQUE_KEY = "42P10"
+# PostgREST error of a write naming a column the table does not have
+UNKNOWN_COLUMN = "PGRST204"
+
+
+class SupabaseDB:
+    """
+    Thin PostgREST client for the Supabase tables used by the app.
+
+    All calls go through a single pooled requests.Session so TCP+TLS
+    connections are kept alive and reused across queries (and across
+    Streamlit reruns when the instance is cached with st.cache_resource).
+
+    Args:
+        url: Supabase project URL.
+        key: API key (anon or service role).
+        pool_size: Max connections kept alive per host.
+        timeout: Default (connect, read) timeout in seconds for every call.
+        max_retries: Retries on 429/5xx and connection errors.
+        backoff_factor: Base delay for exponential backoff between retries.
+        backoff_max: Upper bound for a single backoff sleep.
+        cache: Optional QueryCache for reads. Writes through insert/upsert/update
+            invalidate the cached results of the written table.
+    """
+
+    def __init__(self, url, key, pool_size=10, timeout=(3.05, 30), max_retries=3,
+                 backoff_factor=0.3, backoff_max=5.0, cache=None):
+        self.url = url.rstrip('/') + "/rest/v1"
+        self.headers = {
+            "apikey": key,
+            "Authorization": f"Bearer {key}",
+            "Content-Type": "application/json",
+            "Prefer": "return=representation"
+        }
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.backoff_max = backoff_max
+        self.cache = cache
+        self._table_versions = {}
+        self._table_edits = {}
+
+        self.session = requests.Session()
+        self.session.headers.update({
+            "Accept-Encoding": "gzip, deflate",
+            "Connection": "keep-alive",
+        })
+        # Retries are handled in _request so we can tell idempotent calls apart
+        self._adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", self._adapter)
+        self.session.mount("http://", self._adapter)
+
+        self._lock = threading.Lock()
+        self._counters = {"requests": 0, "retries": 0, "errors": 0}
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self._counters[name] += n
+
+    def _backoff(self, attempt, res=None):
+        """Sleeps before the next attempt, honouring Retry-After on 429/503."""
+        delay = self.backoff_factor * (2 ** attempt)
+        if res is not None:
+            retry_after = res.headers.get("Retry-After")
+            if retry_after and retry_after.isdigit():
+                delay = float(retry_after)
+        time.sleep(min(delay, self.backoff_max))
+
+    def _request(self, method, url, idempotent=True, timeout=None, **kwargs):
+        """
+        Sends a request through the pooled session with bounded exponential backoff.
+
+        Non-idempotent calls (plain inserts) are only retried when the server
+        guarantees nothing was applied (429), never on 5xx or dropped connections.
+        """
+        timeout = timeout or self.timeout
+        attempt = 0
+        with span("supabase.http", method=method) as traced:
+            while True:
+                self._count("requests")
+                try:
+                    res = self.session.request(method, url, timeout=timeout, **kwargs)
+                except (requests.ConnectionError, requests.Timeout):
+                    if not idempotent or attempt >= self.max_retries:
+                        self._count("errors")
+                        raise
+                    self._count("retries")
+                    self._backoff(attempt)
+                    attempt += 1
+                    continue
+
+                retryable = res.status_code == 429 or (idempotent and res.status_code in RETRY_STATUS)
+                if retryable and attempt < self.max_retries:
+                    self._count("retries")
+                    self._backoff(attempt, res)
+                    attempt += 1
+                    continue
+                if res.status_code >= 400:
+                    self._count("errors")
+                if traced:
+                    traced.set(table=self._table_of(url), status=res.status_code,
+                               bytes=len(res.content), retries=attempt)
+                return res
+
+    def _table_of(self, url):
+        return url[len(self.url) + 1:].split("?", 1)[0]
+
+    def _decode(self, res, url):
+        """res.json(), timed apart from the transfer so decode cost shows up on its own."""
+        with span("supabase.json") as traced:
+            rows = res.json()
+            if traced:
+                traced.set(table=self._table_of(url), rows=len(rows) if isinstance(rows, list) else 1)
+            return rows
+
+    def stats(self):
+        """
+        Returns request and connection-pool counters.
+
+        connections_reused = requests served on an already open connection,
+        which is the latency we save on TCP+TLS handshakes.
+        """
+        opened = served = 0
+        pools = self._adapter.poolmanager.pools
+        for pool_key in list(pools.keys()):
+            pool = pools.get(pool_key)
+            if pool is None:
+                continue
+            opened += pool.num_connections
+            served += pool.num_requests
+        with self._lock:
+            counters = dict(self._counters)
+        counters["connections_opened"] = opened
+        counters["connections_reused"] = max(served - opened, 0)
+        return counters
+
+    def close(self):
+        self.session.close()
+
+    def _table_url(self, table, select="*", filters=None):
+        url = f"{self.url}/{table}?select={select}"
+        if filters:
+            for k, v in filters.items():
+                url += f"&{k}={v}"
+        return url
+
+    def _cached(self, key):
+        """Returns a shallow copy of a cached frame so callers can add columns freely."""
+        if self.cache is None or key is None:
+            return None
+        df = self.cache.get(key)
+        return df.copy(deep=False) if df is not None else None
+
+    def _read_versions(self, table, select="*"):
+        """Write counters of every table a read depends on, taken before sending it."""
+        with self._lock:
+            return tuple(self._table_versions.get(t, 0) for t in sorted(QueryCache.tables_for(table, select)))
+
+    def _store(self, key, table, select, df, versions=None):
+        # A read that overlapped a write to its tables may hold pre-write rows: return it, don't cache it
+        if (self.cache is not None and key is not None
+                and (versions is None or versions == self._read_versions(table, select))):
+            self.cache.set(key, df, self.cache.tables_for(table, select))
+        return df.copy(deep=False)
+
+    def _invalidate(self, table, edit=True):
+        with self._lock:
+            self._table_versions[table] = self._table_versions.get(table, 0) + 1
+            if edit:
+                self._table_edits[table] = self._table_edits.get(table, 0) + 1
+        if self.cache is not None:
+            self.cache.invalidate(table)
+
+    def table_version(self, table, edits_only=False):
+        """
+        Number of writes sent to table through this client (lets callers detect own writes).
+        With edits_only, only writes that may change existing rows count (updates and
+        merging upserts, not plain inserts or ignore-duplicates upserts).
+        """
+        with self._lock:
+            return (self._table_edits if edits_only else self._table_versions).get(table, 0)
+
+    def table(self, table):
+        """Starts a QueryBuilder on table (filters are pushed down to PostgREST)."""
+        return QueryBuilder(self, table)
+
+    def count(self, table, filters=None, timeout=None, use_cache=True):
+        """Number of rows matching filters (exact count, transfers at most one row)."""
+        filters = {k: v for k, v in (filters or {}).items() if k not in ("order", "limit", "offset")}
+        key = QueryCache.make_key("count", table, "id", filters) if use_cache else None
+        if self.cache is not None and key is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+        versions = self._read_versions(table)
+        _, total = self._fetch_page(self._table_url(table, "id", filters) + "&limit=1", timeout, count=True)
+        if (self.cache is not None and key is not None and total is not None
+                and versions == self._read_versions(table)):
+            self.cache.set(key, total, self.cache.tables_for(table))
+        return total
+
+    def query(self, table, select="*", filters=None, timeout=None, use_cache=True, raise_errors=False):
+        """
+        Single GET. Errors are shown with st.error and an empty frame is
+        returned, unless raise_errors=True (e.g. when called off the script
+        thread, where st.error cannot render).
+        """
+        key = QueryCache.make_key("query", table, select, filters) if use_cache else None
+        cached = self._cached(key)
+        if cached is not None:
+            return cached
+        url = self._table_url(table, select, filters)
+        versions = self._read_versions(table, select)
+        try:
+            res = self._request("GET", url, headers=self.headers, timeout=timeout)
+            if res.status_code != 200:
+                raise RuntimeError(f"Supabase Query Error ({res.status_code}): {res.text}")
+            return self._store(key, table, select, pd.DataFrame(self._decode(res, url)), versions)
+        except Exception as e:
+            if raise_errors:
+                raise
+            st.error(str(e) if isinstance(e, RuntimeError) else f"Supabase Connection Fatal Error: {str(e)}")
+            return pd.DataFrame()
+
+    def _fetch_page(self, url, timeout=None, count=False):
+        """GETs one page. Returns (rows, total) where total comes from Content-Range."""
+        headers = self.headers
+        if count:
+            headers = self.headers.copy()
+            headers["Prefer"] = "count=exact"
+        res = self._request("GET", url, headers=headers, timeout=timeout)
+        if res.status_code not in (200, 206):
+            raise RuntimeError(f"Supabase Query Error ({res.status_code}): {res.text}")
+        total = None
+        content_range = res.headers.get("Content-Range", "")
+        if "/" in content_range:
+            size = content_range.split("/")[-1]
+            total = int(size) if size.isdigit() else None
+        return self._decode(res, url), total
+
+    def iter_pages(self, table, select="*", filters=None, page_size=1000, max_workers=4,
+                   order_by="id", timeout=None):
+        """
+        Yields the full result of a table read as DataFrame chunks, in order.
+
+        PostgREST silently caps every response (1000 rows by default), so a
+        single query() stops returning rows once a table grows past that.
+        The first page is requested with an exact count; the remaining pages
+        are fetched concurrently with limit/offset over a stable order, using
+        at most max_workers connections from the pool. If the server does not
+        report a count, falls back to sequential keyset paging (order_by=gt.).
+
+        If the server cap is lower than page_size, the page size adapts to
+        the size of the first page so no rows are skipped.
+        """
+        base_url = self._table_url(table, select, filters) + f"&order={order_by}.asc"
+        first, total = self._fetch_page(f"{base_url}&limit={page_size}&offset=0", timeout, count=True)
+        if first:
+            yield pd.DataFrame(first)
+        if not first or len(first) >= (total if total is not None else float("inf")):
+            return
+        page_size = min(page_size, len(first))
+
+        if total is None:
+            # Keyset paging: each page starts after the last key seen
+            last_key = first[-1][order_by]
+            while True:
+                rows, _ = self._fetch_page(
+                    f"{base_url}&{order_by}=gt.{last_key}&limit={page_size}", timeout)
+                if rows:
+                    yield pd.DataFrame(rows)
+                if len(rows) < page_size:
+                    return
+                last_key = rows[-1][order_by]
+
+        offsets = range(len(first), total, page_size)
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+            pages = pool.map(
+                propagate(lambda off: self._fetch_page(f"{base_url}&limit={page_size}&offset={off}", timeout)[0]),
+                offsets,
+            )
+            for rows in pages:
+                if rows:
+                    yield pd.DataFrame(rows)
+
+    def query_all(self, table, select="*", filters=None, page_size=1000, max_workers=4,
+                  order_by="id", timeout=None, use_cache=True, raise_errors=False):
+        """Same as query() but reads every page (see iter_pages) and concatenates once."""
+        key = None
+        if use_cache:
+            key = QueryCache.make_key("all", table, select, {**(filters or {}), "order": order_by})
+        cached = self._cached(key)
+        if cached is not None:
+            return cached
+        versions = self._read_versions(table, select)
+        try:
+            chunks = list(self.iter_pages(table, select, filters, page_size, max_workers, order_by, timeout))
+        except Exception as e:
+            if raise_errors:
+                raise
+            st.error(f"Supabase Paged Query Error: {str(e)}")
+            return pd.DataFrame()
+        df = pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame()
+        return self._store(key, table, select, df, versions)
+
+    def upsert(self, table, data, on_conflict="id", timeout=None, ignore_duplicates=False):
+        headers = self.headers.copy()
+        resolution = "ignore-duplicates" if ignore_duplicates else "merge-duplicates"
+        headers["Prefer"] = f"return=representation,resolution={resolution}"
+        url = f"{self.url}/{table}?on_conflict={on_conflict}"
+        try:
+            res = self._request("POST", url, json=data, headers=headers, timeout=timeout)
+            return res.status_code in [200, 201, 204], res.text
+        except Exception as e:
+            return False, str(e)
+        finally:
+            # After the write lands, so a read in between cannot re-cache pre-write rows
+            self._invalidate(table, edit=not ignore_duplicates)
+
+    def bulk_upsert(self, table, rows, on_conflict="id", chunk_size=None, max_workers=1,
+                    timeout=None, ignore_duplicates=False):
+        """
+        Upserts a list of rows in a single request, or in chunks of chunk_size
+        rows posted concurrently by up to max_workers threads. Each chunk is
+        retried on 429/5xx like any idempotent call.
+
+        Returns (ok_per_row, message): ok_per_row[i] is True when rows[i]
+        came back in the representation returned by PostgREST, matched on
+        the on_conflict columns, and False when its chunk failed. With
+        ignore_duplicates, rows that already existed are left untouched and
+        reported as None. message is the last error, if any.
+        """
+        if not rows:
+            return [], ""
+        if chunk_size and len(rows) > chunk_size:
+            chunks = [rows[start:start + chunk_size] for start in range(0, len(rows), chunk_size)]
+            with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+                results = list(pool.map(
+                    propagate(lambda chunk: self.bulk_upsert(table, chunk, on_conflict, timeout=timeout,
+                                                             ignore_duplicates=ignore_duplicates)),
+                    chunks,
+                ))
+            ok_rows, errors = [], []
+            for chunk_ok, text in results:
+                ok_rows.extend(chunk_ok)
+                if False in chunk_ok:
+                    errors.append(text)
+            return ok_rows, errors[-1] if errors else ""
+        ok, text = self.upsert(table, rows, on_conflict=on_conflict, timeout=timeout,
+                               ignore_duplicates=ignore_duplicates)
+        if not ok:
+            return [False] * len(rows), text
+        keys = on_conflict.split(",")
+        try:
+            returned = {tuple(str(r.get(k)) for k in keys) for r in json.loads(text or "[]")}
+        except ValueError:
+            return [True] * len(rows), text
+        missing = None if ignore_duplicates else False
+        return [True if tuple(str(row.get(k)) for k in keys) in returned else missing for row in rows], text
+
+    def insert(self, table, data, timeout=None):
+        try:
+            res = self._request("POST", f"{self.url}/{table}", idempotent=False, json=data,
+                                headers=self.headers, timeout=timeout)
+            return res.status_code in [200, 201], res.text
+        except Exception as e:
+            return False, str(e)
+        finally:
+            self._invalidate(table, edit=False)
+
+    def update(self, table, data, filters, timeout=None):
+        url = f"{self.url}/{table}"
+        if filters:
+            url += "?" + "&".join([f"{k}={v}" for k, v in filters.items()])
+        try:
+            res = self._request("PATCH", url, json=data, headers=self.headers, timeout=timeout)
+            return res.status_code in [200, 204], res.text
+        except Exception as e:
+            return False, str(e)
+        finally:
+            self._invalidate(table)
+
+
+class QueryBuilder:
+    """
+    Translates filter state into PostgREST query parameters.
+
+    Every method returns the builder, so calls chain:
+
+        sdb.table("facts").select("id,detail").gte("date", "2024-12-25") \
+            .ilike("detail", "lider").order("date", desc=True).limit(500).execute()
+
+    Predicates on the same column are combined with and=(...), so range
+    filters (gte + lte) can be expressed too. Results go through
+    SupabaseDB.query, so they are cached and invalidated like any read.
+    """
+
+    def __init__(self, db, table):
+        self.db = db
+        self.table_name = table
+        self._select = "*"
+        self._predicates = []   # (column, "op.value")
+        self._params = {}       # order / limit / offset / or
+
+    @staticmethod
+    def _value(value):
+        return quote(str(value), safe="*,().:-")
+
+    def select(self, columns):
+        """Columns to return, e.g. "id,detail,categories(name)" (only these are transferred)."""
+        self._select = columns if isinstance(columns, str) else ",".join(columns)
+        return self
+
+    def _where(self, column, op, value):
+        self._predicates.append((column, f"{op}.{value}"))
+        return self
+
+    def eq(self, column, value):
+        return self._where(column, "eq", self._value(value))
+
+    def neq(self, column, value):
+        return self._where(column, "neq", self._value(value))
+
+    def gte(self, column, value):
+        return self._where(column, "gte", self._value(value))
+
+    def lte(self, column, value):
+        return self._where(column, "lte", self._value(value))
+
+    def lt(self, column, value):
+        return self._where(column, "lt", self._value(value))
+
+    def is_(self, column, value):
+        """IS comparison; value is None/True/False (e.g. is_("category_id", None))."""
+        return self._where(column, "is", {None: "null", True: "true", False: "false"}[value])
+
+    def in_(self, column, values):
+        return self._where(column, "in", "(" + ",".join(self._value(v) for v in values) + ")")
+
+    def ilike(self, column, text):
+        """Case-insensitive contains; every whitespace-separated word must appear, in order."""
+        pattern = "*" + "*".join(self._value(w.replace("*", "")) for w in str(text).split()) + "*"
+        return self._where(column, "ilike", pattern)
+
+    def or_(self, *conditions):
+        """Raw PostgREST alternatives, e.g. or_("category_id.is.null", "category_id.eq.4")."""
+        self._params["or"] = "(" + ",".join(conditions) + ")"
+        return self
+
+    def order(self, column, desc=False):
+        """Adds a sort key (call again for tie-breakers)."""
+        key = f"{column}.{'desc' if desc else 'asc'}"
+        self._params["order"] = f"{self._params['order']},{key}" if "order" in self._params else key
+        return self
+
+    def limit(self, n):
+        self._params["limit"] = int(n)
+        return self
+
+    @property
+    def filters(self):
+        """The query as the filters dict accepted by SupabaseDB.query / query_all."""
+        by_column = {}
+        for column, predicate in self._predicates:
+            by_column.setdefault(column, []).append(predicate)
+        filters = {}
+        conjunctions = []
+        for column, predicates in by_column.items():
+            if len(predicates) == 1:
+                filters[column] = predicates[0]
+            else:
+                conjunctions += [f"{column}.{p}" for p in predicates]
+        if conjunctions:
+            filters["and"] = "(" + ",".join(conjunctions) + ")"
+        filters.update(self._params)
+        return filters
+
+    def execute(self, timeout=None, use_cache=True, raise_errors=False):
+        """Runs the query; returns a DataFrame with the selected columns."""
+        return self.db.query(self.table_name, select=self._select, filters=self.filters,
+                             timeout=timeout, use_cache=use_cache, raise_errors=raise_errors)
+
+    def count(self, timeout=None, use_cache=True):
+        """Exact number of matching rows, ignoring order/limit."""
+        return self.db.count(self.table_name, filters=self.filters, timeout=timeout, use_cache=use_cache)